@@ -1,20 +1,23 @@
 import streamlit as st
-import asyncio
-import nest_asyncio
 from chat_page import chat_page
 from test_page import test_page
+from prefetcher import start_prefetcher
+from async_runtime import ScriptAbandoned
 
-nest_asyncio.apply()
-
-async def main():
+def main():
     st.set_page_config(page_title="討論區數據分析", layout="wide")
+    start_prefetcher()
     
     page = st.sidebar.selectbox("選擇頁面", ["聊天介面", "測試頁面"])
     
-    if page == "聊天介面":
-        await chat_page()
-    elif page == "測試頁面":
-        await test_page()
+    try:
+        if page == "聊天介面":
+            chat_page()
+        elif page == "測試頁面":
+            test_page()
+    except ScriptAbandoned:
+        # 用戶停止或重新提交，腳本即將重跑：不顯示錯誤，只解除處理中狀態
+        st.session_state.processing_request = False
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
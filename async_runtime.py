@@ -0,0 +1,191 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import threading
+import time
+import aiohttp
+import streamlit as st
+import streamlit.logger
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+logger = streamlit.logger.get_logger(__name__)
+
+# 提交協程時綁定的 Streamlit 腳本上下文，讓背景線程中的協程能存取所屬會話
+_script_ctx = contextvars.ContextVar("script_ctx", default=None)
+
+@contextlib.contextmanager
+def _attached(ctx):
+    # 在同步讀寫期間把腳本上下文掛到當前線程，讓 Streamlit 的線程檢查通過；期間沒有 await，不會與其他會話交錯
+    thread = threading.current_thread()
+    previous = getattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+    setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, ctx)
+    try:
+        yield
+    finally:
+        setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, previous)
+
+class BoundSessionState:
+    """以 st.session_state 相同的方式存取某個會話的狀態（可在非腳本線程中使用）"""
+
+    __slots__ = ("_ctx",)
+
+    def __init__(self, ctx):
+        object.__setattr__(self, "_ctx", ctx)
+
+    def __getattr__(self, key):
+        with _attached(self._ctx):
+            return getattr(self._ctx.session_state, key)
+
+    def __setattr__(self, key, value):
+        with _attached(self._ctx):
+            setattr(self._ctx.session_state, key, value)
+
+    def __getitem__(self, key):
+        with _attached(self._ctx):
+            return self._ctx.session_state[key]
+
+    def __setitem__(self, key, value):
+        with _attached(self._ctx):
+            self._ctx.session_state[key] = value
+
+    def __delitem__(self, key):
+        with _attached(self._ctx):
+            del self._ctx.session_state[key]
+
+    def __contains__(self, key):
+        with _attached(self._ctx):
+            return key in self._ctx.session_state
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+def current_script_ctx():
+    """返回當前協程所屬的腳本上下文；在腳本線程中直接讀取線程上下文"""
+    ctx = _script_ctx.get()
+    return ctx if ctx is not None else get_script_run_ctx(suppress_warning=True)
+
+def session_state():
+    """返回當前協程所屬會話的 session_state；沒有綁定會話時退回 st.session_state"""
+    ctx = _script_ctx.get()
+    if ctx is None:
+        return st.session_state
+    return BoundSessionState(ctx)
+
+async def _bind(awaitable, ctx):
+    if ctx is not None:
+        _script_ctx.set(ctx)
+    return await awaitable
+
+class ScriptAbandoned(BaseException):
+    """用戶停止或重新提交時，runtime.run 取消協程後拋出；繼承 BaseException，頁面的 except Exception 不會把它當作處理失敗"""
+
+# 腳本線程等待結果時檢查是否被放棄的間隔（秒）
+ABANDON_POLL_INTERVAL = 0.2
+
+_abandon_check_missing = False
+
+def _abandoned(ctx) -> bool:
+    # 用戶按停止或重新提交時，腳本請求會進入停止/重跑狀態。
+    # Streamlit 沒有公開的停止訊號，這裡讀取私有的 ScriptRunContext.script_requests._state
+    # （按 Streamlit 1.66 核對）；屬性不存在或結構改變時視為未放棄，只是不能提前取消協程
+    global _abandon_check_missing
+    try:
+        requests = getattr(ctx, "script_requests", None)
+        state = getattr(requests, "_state", None)
+        name = getattr(state, "name", None)
+    except Exception:
+        name = None
+    if name is None:
+        if ctx is not None and not _abandon_check_missing:
+            _abandon_check_missing = True
+            logger.warning("Cannot read Streamlit script request state; abandoned requests will not be cancelled early")
+        return False
+    return name in ("STOP", "RERUN")
+
+class BackgroundLoop:
+    """常駐的事件循環線程：連接池、速率限制器和背景任務在整個進程生命週期內保留"""
+
+    def __init__(self, name: str = "async-runtime"):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._started = threading.Event()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+        logger.info(f"Background event loop started: name={self.name}")
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, awaitable):
+        """提交協程到常駐事件循環，返回線程安全的 concurrent.futures.Future"""
+        if self.in_loop_thread():
+            raise RuntimeError("Cannot block on the runtime loop from inside the loop thread")
+        return asyncio.run_coroutine_threadsafe(_bind(awaitable, get_script_run_ctx(suppress_warning=True)), self.loop)
+
+    def run(self, awaitable, timeout: float = None):
+        """提交協程並在調用線程中等待結果；腳本被停止或重跑時取消協程"""
+        future = self.submit(awaitable)
+        ctx = get_script_run_ctx(suppress_warning=True)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            try:
+                return future.result(ABANDON_POLL_INTERVAL if remaining is None else min(remaining, ABANDON_POLL_INTERVAL))
+            except concurrent.futures.TimeoutError:
+                if remaining is not None and remaining <= ABANDON_POLL_INTERVAL:
+                    future.cancel()
+                    raise
+                if _abandoned(ctx):
+                    # 用戶放棄了問題：取消協程，讓排隊中的請求釋放位置
+                    future.cancel()
+                    logger.info("Script run abandoned, cancelled pending runtime work")
+                    raise ScriptAbandoned() from None
+
+    def spawn(self, awaitable):
+        """提交不需等待結果的背景任務（不綁定任何會話）"""
+        return asyncio.run_coroutine_threadsafe(_bind(awaitable, None), self.loop)
+
+    def iterate(self, agen):
+        """把異步生成器轉為同步生成器，供 st.write_stream 在腳本線程中逐塊讀取"""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+def get_runtime() -> BackgroundLoop:
+    """返回進程內唯一的常駐事件循環，首次調用時啟動"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = BackgroundLoop()
+            _runtime.start()
+        return _runtime
+
+_http_sessions = {}
+
+def http_session(name: str) -> aiohttp.ClientSession:
+    """返回綁定在當前事件循環上的共享 ClientSession，連接池跨請求重用"""
+    loop = asyncio.get_running_loop()
+    key = (id(loop), name)
+    session = _http_sessions.get(key)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession()
+        _http_sessions[key] = session
+    return session
@@ -0,0 +1,76 @@
+"""比較帖子及回覆以 dict 與 records 中 __slots__ 記錄存放時的記憶體佔用
+
+用法：python benchmarks/bench_record_memory.py [回覆數量]
+
+按 LIHKG 解析後的欄位生成一個大帖子的回覆及一頁帖子列表，以 tracemalloc 量度建立容器本身的額外分配；
+欄位值（字串、數字）預先建立並由兩種表示共用，因此差額只反映每筆記錄的容器開銷。
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from records import TopicItem, Reply, ReplyExcerpt
+
+PHRASES = ["今日港鐵又壞車", "樓主講得好啱", "呢個真係on9", "笑死我", "咁都得？", "有冇人知點解", "Good job lol"]
+
+def make_reply_fields(n, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "msg": " ".join(rng.choice(PHRASES) for _ in range(rng.randint(1, 4))) + f" #{i}",
+            "post_id": f"{rng.getrandbits(64):016x}",
+            "msg_num": i + 1,
+            "quote_post_id": None,
+            "like_count": rng.randint(0, 50),
+            "dislike_count": rng.randint(0, 10)
+        }
+        for i in range(n)
+    ]
+
+def make_topic_fields(n, seed=11):
+    rng = random.Random(seed)
+    return [
+        {
+            "thread_id": 3000000 + i,
+            "title": rng.choice(PHRASES) + f" {i}",
+            "no_of_reply": rng.randint(0, 1000),
+            "last_reply_time": 1700000000 + rng.randint(0, 86400),
+            "like_count": rng.randint(0, 200),
+            "dislike_count": rng.randint(0, 50)
+        }
+        for i in range(n)
+    ]
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, objects
+
+def report(name, count, build_dicts, build_records):
+    dict_size, dicts = measure(build_dicts)
+    record_size, records = measure(build_records)
+    assert all(record[key] == value for record, item in zip(records, dicts) for key, value in item.items()), "fields differ"
+    print(
+        f"{name}: n={count} dict={dict_size / count:.0f}B/item slots={record_size / count:.0f}B/item "
+        f"saved={(1 - record_size / dict_size) * 100:.0f}%"
+    )
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    replies = make_reply_fields(count)
+    topics = make_topic_fields(min(count, 500))
+    report("Reply", count, lambda: [dict(fields) for fields in replies], lambda: [Reply(**fields) for fields in replies])
+    report("TopicItem", len(topics), lambda: [dict(fields) for fields in topics], lambda: [TopicItem(**fields) for fields in topics])
+    report(
+        "ReplyExcerpt", count,
+        lambda: [{"content": fields["msg"], "ref": f"#{fields['msg_num']}"} for fields in replies],
+        lambda: [ReplyExcerpt(content=fields["msg"], ref=f"#{fields['msg_num']}") for fields in replies]
+    )
+
+if __name__ == "__main__":
+    main()
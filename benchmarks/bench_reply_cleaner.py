@@ -0,0 +1,80 @@
+"""比較回覆清理：原本的多次正則替換 vs reply_cleaner 單次掃描
+
+用法：python benchmarks/bench_reply_cleaner.py [LIHKG 帖子頁 JSON ...]
+
+可傳入從 /api_v2/thread/{id}/message?page={n} 保存的回應（response.items[].msg，與 lihkg_api 讀取的欄位一致）；
+未提供時按 LIHKG 回覆的常見格式生成一頁樣本（表情、換行、引用、實體、連結）。
+"""
+import html
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reply_cleaner import clean_replies
+
+EMOJIS = ["[sosad]", "[hehe]", "[angry]", "[369]", "[bye]", "[like]"]
+PHRASES = ["今日港鐵又壞車", "樓主講得好啱", "呢個真係on9", "推", "笑死我", "咁都得？", "有冇人知點解", "Good job lol", "睇完成個人都唔好"]
+
+def make_page(n=25, seed=7):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(n):
+        parts = []
+        for _ in range(rng.randint(1, 6)):
+            choice = rng.random()
+            if choice < 0.2:
+                emoji = rng.choice(EMOJIS)
+                parts.append(f'<img src="/assets/faces/normal/{emoji[1:-1]}.gif" class="hkgmoji" alt="{emoji}" />')
+            elif choice < 0.35:
+                parts.append("<br />\n")
+            elif choice < 0.45:
+                parts.append(f"<blockquote>{rng.choice(PHRASES)}<br /></blockquote>")
+            elif choice < 0.5:
+                parts.append(f'<a href="https://lihkg.com/thread/{rng.randint(1000000, 3999999)}" target="_blank">連結</a>')
+            elif choice < 0.55:
+                parts.append("&amp; &lt;3 &quot;")
+            else:
+                parts.append(rng.choice(PHRASES) + " " * rng.randint(0, 2))
+        messages.append("".join(parts))
+    return messages
+
+def load_page(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return [item.get("msg", "") for item in data["response"]["items"]]
+
+def old_clean_reply_text(text):
+    """原本 data_processor.clean_reply_text 的做法"""
+    text = re.sub(r'<img[^>]+alt="\[([^\]]+)\]"[^>]*>', r'[\1]', text)
+    clean = re.compile(r'<[^>]+>')
+    text = clean.sub('', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    text = ' '.join(text.split())
+    if len(text) <= 5:
+        return None
+    return text
+
+def reference_clean(text):
+    """多次替換的參考實現，語義與單次掃描相同（<br> 及區塊標籤視為空白，實體還原），用於核對結果"""
+    text = re.sub(r'<img\b[^>]*?\balt="\[([^\]"]+)\]"[^>]*>', r'[\1]', text)
+    text = re.sub(r'<br\b[^>]*>|</?(?:p|div|blockquote|li|ul|ol|tr|h[1-6])\b[^>]*>', ' ', text)
+    text = re.sub(r'<[^>]*>', '', text)
+    text = re.sub(r'&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);', lambda m: html.unescape(m.group()), text)
+    text = ' '.join(text.split())
+    return text if len(text) > 5 else None
+
+def main():
+    pages = [(path, load_page(path)) for path in sys.argv[1:]] or [("generated", make_page())]
+    for name, messages in pages:
+        assert clean_replies(messages) == [reference_clean(message) for message in messages], "results differ"
+        old_time = min(timeit.repeat(lambda: [old_clean_reply_text(message) for message in messages], number=200, repeat=5)) / 200
+        new_time = min(timeit.repeat(lambda: clean_replies(messages), number=200, repeat=5)) / 200
+        size = sum(len(message) for message in messages)
+        print(f"{name}: replies={len(messages)} chars={size} old={old_time * 1000:.3f}ms single_pass={new_time * 1000:.3f}ms speedup={old_time / new_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
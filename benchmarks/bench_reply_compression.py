@@ -0,0 +1,50 @@
+"""比較共享帖子內容緩存中回覆壓縮的各算法及等級：壓縮率、記憶體佔用及壓縮/解壓吞吐量
+
+用法：python benchmarks/bench_reply_compression.py [LIHKG 帖子頁 JSON ...]
+
+未提供帖子頁時以 bench_reply_cleaner 的樣本生成 10 頁回覆（一個常見的大帖子）。
+記憶體以 session_cache.estimate_size 量度（與緩存預算的計算方式相同）；
+序列化後未壓縮及壓縮後的位元組數即寫入磁碟時所需的空間。
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_reply_cleaner import make_page, load_page
+from records import Reply
+from reply_compression import Codec, ReplyCompressor, zstandard
+from session_cache import estimate_size
+
+LEVELS = {"zlib": [1, 6, 9], "zstd": [1, 3, 9, 19]}
+
+def make_replies(messages):
+    return [Reply(msg=msg, post_id=f"{i:016x}", msg_num=i + 1, like_count=i % 7, dislike_count=i % 3) for i, msg in enumerate(messages)]
+
+def main():
+    messages = [msg for path in sys.argv[1:] for msg in load_page(path)]
+    if not messages:
+        messages = [msg for seed in range(10) for msg in make_page(seed=seed)]
+    replies = make_replies(messages)
+    plain_size = estimate_size(replies)
+    print(f"replies={len(replies)} in_memory={plain_size / 1024:.1f}KB")
+    for name, levels in LEVELS.items():
+        if name == "zstd" and zstandard is None:
+            print("zstd: zstandard 未安裝，略過")
+            continue
+        for level in levels:
+            compressor = ReplyCompressor(dict(ENABLED=True, CODEC=name, ZSTD_LEVEL=level, ZLIB_LEVEL=level, MIN_BYTES=0))
+            compressed = compressor.compress(replies)
+            assert [reply.to_dict() for reply in compressed] == [reply.to_dict() for reply in replies], "results differ"
+            compress_time = min(timeit.repeat(lambda: compressor.compress(replies), number=10, repeat=3)) / 10
+            decompress_time = min(timeit.repeat(compressed.decompress, number=10, repeat=3)) / 10
+            raw_mb = compressed.raw_bytes / 1024 / 1024
+            print(
+                f"{Codec(name, level)}: serialized={compressed.raw_bytes / 1024:.1f}KB stored={len(compressed.data) / 1024:.1f}KB "
+                f"ratio={compressed.raw_bytes / len(compressed.data):.1f}x in_memory={estimate_size(compressed) / 1024:.1f}KB "
+                f"({estimate_size(compressed) / plain_size * 100:.0f}%) compress={raw_mb / compress_time:.0f}MB/s "
+                f"decompress={raw_mb / decompress_time:.0f}MB/s ({decompress_time * 1000:.2f}ms)"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""比較「全部回覆」大帖子的峰值記憶體：回覆全部存放在列表 vs ReplySpool 寫入臨時檔案
+
+用法：python benchmarks/bench_reply_spool.py [回覆數量 ...]
+
+按 bench_reply_cleaner 的樣本生成帖子回覆，模擬抓取（逐頁加入）及 select_replies 選出提示詞回覆的整個過程，
+以 tracemalloc 量度峰值；不寫入臨時檔案時把 REPLY_SPOOL["ENABLED"] 設為 False。
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_reply_cleaner import make_page
+from config import REPLY_SPOOL
+from data_processor import select_replies
+from records import Reply
+from relevance import query_tokens
+from reply_spool import ReplySpool
+
+QUESTION = "有冇人知點解港鐵又壞車"
+
+def fetch_pages(count):
+    """逐頁產生回覆，每頁 100 條，與 LIHKG 的分頁一致"""
+    for start in range(0, count, 100):
+        messages = make_page(n=min(100, count - start), seed=start)
+        yield [
+            Reply(msg=msg, post_id=f"{start + i:016x}", msg_num=start + i + 1, like_count=i % 7)
+            for i, msg in enumerate(messages)
+        ]
+
+def run(count, spool):
+    REPLY_SPOOL["ENABLED"] = spool
+    query = query_tokens(QUESTION)
+    tracemalloc.start()
+    start = time.perf_counter()
+    replies = ReplySpool()
+    for page in fetch_pages(count):
+        replies.extend(page)
+    selected = select_replies(replies, query)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    replies.close()
+    return peak, elapsed, selected
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    for count in counts:
+        list_peak, list_time, list_selected = run(count, spool=False)
+        spool_peak, spool_time, spool_selected = run(count, spool=True)
+        assert [reply.to_dict() for reply in list_selected] == [reply.to_dict() for reply in spool_selected], "results differ"
+        print(
+            f"replies={count}: list peak={list_peak / 1024 / 1024:.1f}MB ({list_time:.2f}s) "
+            f"spool peak={spool_peak / 1024 / 1024:.1f}MB ({spool_time:.2f}s)"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""比較帖子篩選及排序：原本逐個字典的循環 vs TopicColumns 向量化篩選和 top-k
+
+用法：python benchmarks/bench_topic_store.py [帖子數量 ...]
+"""
+import os
+import random
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from topic_store import TopicColumns
+from keyword_matcher import matcher_for_condition
+
+HONG_KONG_TZ = pytz.timezone("Asia/Hong_Kong")
+ON9_KEYWORDS = ["搞笑", "荒謬", "無語", "惡搞", "迷因", "傻", "荒唐"]
+WORDS = ["政府", "港鐵", "搞笑", "樓市", "迷因", "天氣", "on9", "食飯", "返工", "荒謬", "足球", "電影"]
+
+def make_items(n, seed=42):
+    rng = random.Random(seed)
+    now = time.time()
+    return [
+        {
+            "thread_id": i,
+            "title": "".join(rng.choice(WORDS) for _ in range(4)),
+            "no_of_reply": rng.choice([0, rng.randint(1, 5000)]),
+            "create_time": now - rng.uniform(0, 30 * 86400),
+            "last_reply_time": now - rng.uniform(0, 400 * 86400),
+            "like_count": rng.randint(0, 500),
+            "dislike_count": rng.randint(0, 100)
+        }
+        for i in range(n)
+    ]
+
+def loop_select(items, filter_condition, k):
+    """原本 process_user_question 中的篩選及排序循環"""
+    today = datetime.now(HONG_KONG_TZ).date()
+    seven_days_ago = today - timedelta(days=7)
+    one_year_ago = int(time.time()) - 365 * 24 * 3600
+    filtered_items = []
+    for item in items:
+        create_time = item.get("create_time", 0)
+        last_reply_time = item.get("last_reply_time", 0)
+        no_of_reply = item.get("no_of_reply", 0)
+        title = item.get("title", "").lower()
+        try:
+            datetime.fromtimestamp(last_reply_time, tz=HONG_KONG_TZ).strftime('%Y-%m-%d %H:%M:%S')
+        except (ValueError, OSError):
+            continue
+        if last_reply_time < one_year_ago:
+            continue
+        if no_of_reply == 0:
+            continue
+        if "優先選擇今日發布的帖子" in filter_condition:
+            create_date = datetime.fromtimestamp(create_time, tz=HONG_KONG_TZ).date() if create_time else today
+            if create_date < seven_days_ago:
+                continue
+        if "on9" in filter_condition and not ("on9" in title or any(kw in title for kw in ON9_KEYWORDS)):
+            continue
+        filtered_items.append(item)
+    if "按回覆數量排序" in filter_condition:
+        selected = sorted(filtered_items, key=lambda x: (x.get("no_of_reply", 0), x.get("last_reply_time", 0)), reverse=True)
+    else:
+        selected = sorted(filtered_items, key=lambda x: x.get("last_reply_time", 0), reverse=True)
+    return selected[:k]
+
+def columnar_select(items, filter_condition, k):
+    """data_processor 現時的向量化篩選"""
+    today = datetime.now(HONG_KONG_TZ).date()
+    seven_days_ago = today - timedelta(days=7)
+    one_year_ago = int(time.time()) - 365 * 24 * 3600
+    store = TopicColumns(items)
+    mask = store.replied_since(one_year_ago) & store.has_replies()
+    if "優先選擇今日發布的帖子" in filter_condition:
+        mask &= store.created_since(HONG_KONG_TZ.localize(datetime.combine(seven_days_ago, datetime.min.time())).timestamp())
+    matcher = matcher_for_condition(filter_condition)
+    if matcher:
+        mask &= store.title_matches(matcher)
+    keys = ("no_of_reply", "last_reply_time") if "按回覆數量排序" in filter_condition else ("last_reply_time",)
+    return store.take(store.top_k(mask, k, keys))
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [600, 5000, 20000]
+    conditions = ["按最後回覆時間排序", "on9 按回覆數量排序 優先選擇今日發布的帖子"]
+    for n in sizes:
+        items = make_items(n)
+        for condition in conditions:
+            expected = loop_select(items, condition, 10)
+            actual = columnar_select(items, condition, 10)
+            assert [item["thread_id"] for item in expected] == [item["thread_id"] for item in actual], "results differ"
+            repeat = max(3, 20000 // n)
+            loop_time = min(timeit.repeat(lambda: loop_select(items, condition, 10), number=1, repeat=repeat))
+            columnar_time = min(timeit.repeat(lambda: columnar_select(items, condition, 10), number=1, repeat=repeat))
+            print(f"n={n:>6} condition={condition!r}: loop={loop_time * 1000:8.2f}ms columnar={columnar_time * 1000:8.2f}ms speedup={loop_time / columnar_time:5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 import streamlit as st
-import asyncio
 from datetime import datetime
 import pytz
 import re
 from data_processor import process_user_question
+from session_cache import init_session_cache
+from async_runtime import get_runtime
 import time
 from config import LIHKG_API, HKGOLDEN_API, GENERAL
 import streamlit.logger
@@ -11,22 +12,21 @@ import traceback
 
 logger = streamlit.logger.get_logger(__name__)
 HONG_KONG_TZ = pytz.timezone(GENERAL["TIMEZONE"])
+STALE_WARNING = "{platform} 暫時無法連接，以下回答基於較早前的緩存數據，可能不是最新。"
 
-async def chat_page():
+def chat_page():
+    runtime = get_runtime()
     st.title("討論區聊天介面")
     
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+    init_session_cache("chat_history", history=True)
     if "rate_limit_until" not in st.session_state:
         st.session_state.rate_limit_until = 0
     if "request_counter" not in st.session_state:
         st.session_state.request_counter = 0
     if "last_reset" not in st.session_state:
         st.session_state.last_reset = time.time()
-    if "thread_content_cache" not in st.session_state:
-        st.session_state.thread_content_cache = {}
-    if "thread_id_cache" not in st.session_state:
-        st.session_state.thread_id_cache = {}
+    init_session_cache("thread_content_cache")
+    init_session_cache("thread_id_cache")
     if "last_submit_key" not in st.session_state:
         st.session_state.last_submit_key = None
     if "last_submit_time" not in st.session_state:
@@ -55,6 +55,8 @@ async def chat_page():
                 st.markdown("**提示預覽**：")
                 st.code(chat['response'], language="text")
             else:
+                if chat.get("stale"):
+                    st.warning(STALE_WARNING.format(platform=chat.get("platform", "討論區")))
                 response = chat['response']
                 if isinstance(response, str):
                     response = response.strip()
@@ -72,8 +74,10 @@ async def chat_page():
                     if reason_match:
                         reason = reason_match.group(1).strip()
                         st.markdown(f"**選擇理由**：{reason}")
+                elif response.is_complete or response.failed:
+                    st.markdown(response.text())
                 else:
-                    st.write_stream(response)
+                    st.write_stream(runtime.iterate(response.replay()))
             
             if chat.get("debug_info") or chat.get("analysis"):
                 with st.expander("調試信息"):
@@ -129,13 +133,13 @@ async def chat_page():
             else:
                 try:
                     logger.info(f"Calling process_user_question for preview: question={user_input}, platform={platform}, category={selected_cat}")
-                    result = await process_user_question(
+                    result = runtime.run(process_user_question(
                         user_input,
                         platform=platform,
                         cat_id_map=categories,
                         selected_cat=selected_cat,
                         return_prompt=True
-                    )
+                    ))
                     st.session_state.thread_content_cache[cache_key] = {
                         "data": result,
                         "timestamp": time.time()
@@ -214,7 +218,8 @@ async def chat_page():
             cache_key = f"{platform}_{selected_cat}_{user_input}"
             use_cache = cache_key in st.session_state.thread_content_cache and \
                         time.time() - st.session_state.thread_content_cache[cache_key]["timestamp"] < \
-                        (LIHKG_API["CACHE_DURATION"] if platform == "LIHKG" else HKGOLDEN_API["CACHE_DURATION"])
+                        (LIHKG_API["CACHE_DURATION"] if platform == "LIHKG" else HKGOLDEN_API["CACHE_DURATION"]) and \
+                        not getattr(st.session_state.thread_content_cache[cache_key]["data"].get("response"), "failed", False)
             
             if use_cache:
                 logger.info(f"Using cache: platform={platform}, category={selected_cat}, question={user_input}")
@@ -222,16 +227,18 @@ async def chat_page():
             else:
                 try:
                     logger.info(f"Calling process_user_question: question={user_input}, platform={platform}, category={selected_cat}")
-                    result = await process_user_question(
+                    result = runtime.run(process_user_question(
                         user_input,
                         platform=platform,
                         cat_id_map=categories,
                         selected_cat=selected_cat
-                    )
-                    st.session_state.thread_content_cache[cache_key] = {
-                        "data": result,
-                        "timestamp": time.time()
-                    }
+                    ))
+                    # 熔斷期間基於舊緩存的回答不寫入緩存，恢復後重新提問可得到最新結果
+                    if not result.get("stale"):
+                        st.session_state.thread_content_cache[cache_key] = {
+                            "data": result,
+                            "timestamp": time.time()
+                        }
                 except Exception as e:
                     debug_info = [
                         f"#### 調試信息：",
@@ -253,6 +260,8 @@ async def chat_page():
                     return
             
             response = result.get("response")
+            if result.get("stale"):
+                st.warning(STALE_WARNING.format(platform=platform))
             if isinstance(response, str):
                 response = response.strip()
                 response = re.sub(r'\{\{ output \}\}|\{ output \}', '', response).strip()
@@ -270,7 +279,16 @@ async def chat_page():
                     reason = reason_match.group(1).strip()
                     placeholder.markdown(f"**選擇理由**：{reason}")
             else:
-                placeholder.write_stream(response)
+                try:
+                    placeholder.write_stream(runtime.iterate(response.replay()))
+                finally:
+                    if response.failed:
+                        # 中途失敗的回應只有部分內容，不保留在緩存中
+                        if cache_key in st.session_state.thread_content_cache:
+                            del st.session_state.thread_content_cache[cache_key]
+                    else:
+                        # 流式回應物化後體積增加，重新計入緩存大小
+                        st.session_state.thread_content_cache.refresh(cache_key)
             
             if result.get("rate_limit_info"):
                 debug_info.append("#### 調試信息：")
@@ -289,6 +307,8 @@ async def chat_page():
                     "response": response,
                     "debug_info": debug_info if debug_info else None,
                     "analysis": result.get("analysis"),
+                    "stale": result.get("stale", False),
+                    "platform": platform,
                     "timestamp": current_time
                 })
             
@@ -296,4 +316,4 @@ async def chat_page():
             st.session_state.processing_request = False
 
 if __name__ == "__main__":
-    asyncio.run(chat_page())
+    chat_page()
@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+import streamlit.logger
+from config import CIRCUIT_BREAKER
+
+logger = streamlit.logger.get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """主機熔斷中，請求不會發出"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} 暫時無法連接（熔斷中），約 {retry_in:.0f} 秒後重試")
+        self.host = host
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    """單一主機的熔斷器：近期錯誤率或慢回應比例過高時斷開，冷卻後以少量試探請求決定是否恢復"""
+
+    def __init__(self, host: str, config: dict = CIRCUIT_BREAKER):
+        self.host = host
+        self.window = config["WINDOW"]
+        self.min_requests = config["MIN_REQUESTS"]
+        self.error_rate = config["ERROR_RATE"]
+        self.slow_call = config["SLOW_CALL"]
+        self.slow_rate = config["SLOW_RATE"]
+        self.open_seconds = config["OPEN_SECONDS"]
+        self.half_open_probes = config["HALF_OPEN_PROBES"]
+        self.max_inline_wait = config["MAX_INLINE_WAIT"]
+        self.state = CLOSED
+        self.opened_until = 0.0
+        self.probes = 0
+        self.outcomes = deque()
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+
+    def _trim(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > self.window:
+            self.outcomes.popleft()
+
+    def _open(self, now: float, seconds: float, reason: str):
+        self.state = OPEN
+        self.opened_until = now + seconds
+        self.probes = 0
+        self.stats["opened"] += 1
+        logger.warning(f"Circuit opened: host={self.host}, 原因={reason}, 冷卻 {seconds:.0f} 秒")
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_until - time.time())
+
+    def is_open(self) -> bool:
+        """熔斷中且冷卻未結束時返回 True（不改變狀態）"""
+        return self.state == OPEN and time.time() < self.opened_until
+
+    def check(self):
+        """排隊前的檢查：熔斷中或試探名額已用完時拋出 CircuitOpenError，不佔用試探名額"""
+        now = time.time()
+        with self._lock:
+            if self.state == CLOSED or (self.state == OPEN and now >= self.opened_until):
+                return
+            if self.state == HALF_OPEN and self.probes < self.half_open_probes:
+                return
+            self.stats["rejected"] += 1
+            retry_in = max(0.0, self.opened_until - now)
+        raise CircuitOpenError(self.host, retry_in)
+
+    def before_request(self) -> bool:
+        """請求即將發出時調用（已通過排程及節奏控制）；返回是否佔用了試探名額，熔斷中直接拋出 CircuitOpenError
+
+        佔用試探名額的請求必須以 record() 記錄結果，或以 release() 歸還名額。
+        """
+        now = time.time()
+        with self._lock:
+            if self.state == OPEN and now >= self.opened_until:
+                self.state = HALF_OPEN
+                self.probes = 0
+                logger.info(f"Circuit half-open: host={self.host}, 允許 {self.half_open_probes} 個試探請求")
+            if self.state == HALF_OPEN:
+                if self.probes < self.half_open_probes:
+                    self.probes += 1
+                    return True
+            elif self.state == CLOSED:
+                return False
+            self.stats["rejected"] += 1
+            retry_in = max(0.0, self.opened_until - now)
+        raise CircuitOpenError(self.host, retry_in)
+
+    def release(self, probe: bool):
+        """請求被取消、搶佔或因其他錯誤中止而沒有結果時歸還試探名額"""
+        if not probe:
+            return
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def record(self, status: int = None, latency: float = 0.0, retry_after: float = None):
+        """記錄請求結果；status 為 None 表示連接失敗或逾時"""
+        now = time.time()
+        failed = status is None or status == 429 or status >= 500
+        slow = latency >= self.slow_call
+        with self._lock:
+            self.stats["failures" if failed else "successes"] += 1
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._open(now, self.open_seconds, f"試探請求失敗 status={status}, latency={latency:.2f}s")
+                else:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                    logger.info(f"Circuit closed: host={self.host}, 試探請求成功")
+                return
+            if status == 429 and retry_after is not None and retry_after > self.max_inline_wait:
+                # 伺服器要求的冷卻時間過長，不在請求內等待，直接熔斷至冷卻結束
+                self._open(now, retry_after, f"Retry-After={retry_after:.0f}s")
+                return
+            self.outcomes.append((now, failed, slow))
+            self._trim(now)
+            if self.state != CLOSED or len(self.outcomes) < self.min_requests:
+                return
+            total = len(self.outcomes)
+            errors = sum(1 for _, f, _ in self.outcomes if f)
+            slows = sum(1 for _, _, s in self.outcomes if s)
+            if errors / total >= self.error_rate:
+                self._open(now, self.open_seconds, f"錯誤率 {errors}/{total}")
+            elif slows / total >= self.slow_rate:
+                self._open(now, self.open_seconds, f"慢回應 {slows}/{total}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._trim(time.time())
+            return dict(self.stats, state=self.state, retry_in=round(self.retry_in(), 1), window_requests=len(self.outcomes))
+
+class BreakerRegistry:
+    """按主機管理熔斷器"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> CircuitBreaker:
+        host = urlparse(url).netloc or url
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(host)
+                self._breakers[host] = breaker
+            return breaker
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.host: breaker.snapshot() for breaker in breakers}
+
+breaker_registry = BreakerRegistry()
+
+def get_breaker(url: str) -> CircuitBreaker:
+    return breaker_registry.get(url)
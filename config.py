@@ -2,6 +2,131 @@ GENERAL = {
     "TIMEZONE": "Asia/Hong_Kong"
 }
 
+CACHE = {
+    "SESSION_MAX_BYTES": 32 * 1024 * 1024,  # 每個會話所有緩存合計上限
+    "GLOBAL_MAX_BYTES": 512 * 1024 * 1024,  # 所有會話合計上限
+    "MAX_ENTRIES": 500,  # 單個緩存的項目上限
+    "HISTORY_MAX_ENTRIES": 100  # 聊天/Prompt 記錄保留條數
+}
+
+CACHE_COMPRESSION = {
+    "ENABLED": True,  # 共享帖子內容緩存中的回覆以壓縮形式存放，用於提示詞時才解壓
+    "CODEC": "auto",  # "zstd"、"zlib" 或 "auto"（已安裝 zstandard 時用 zstd，否則用 zlib）
+    "ZSTD_LEVEL": 3,  # 1-22，等級越高壓縮率越好但壓縮越慢，解壓速度差別不大
+    "ZLIB_LEVEL": 6,  # 1-9
+    "MIN_BYTES": 2048  # 序列化後小於此大小的回覆列表不壓縮
+}
+
+REPLY_SPOOL = {
+    "ENABLED": True,  # 大帖子（例如「全部回覆」）的回覆超出記憶體上限後寫入臨時檔案，按需逐批讀回
+    "MEMORY_RECORDS": 500,  # 每個帖子保留在記憶體中的回覆數量（約 5 頁）
+    "DIR": None  # 臨時檔案目錄，None 時使用系統預設
+}
+
+PREFETCH = {
+    "ENABLED": True,
+    "INTERVAL": 120,  # 秒，每輪刷新所有分類的間隔
+    "TOPIC_PAGES": 3,  # 每個分類預取的列表頁數
+    "TOP_K": 3,  # 每個分類預取內容的最活躍帖子數量
+    "MAX_REPLIES": 100,  # 每個帖子預取的回覆上限（一頁）
+    "MAX_AGE": 300,  # 秒，共享緩存中預取數據的有效期
+    "BUDGET_SHARE": 0.3  # 可使用的速率限制預算比例
+}
+
+SCHEDULER = {
+    "BULK_SHARE": 0.2,  # 批量導出可使用的速率限制預算比例
+    "PREEMPT_PREFETCH": True  # 互動請求需要排隊時，放棄排隊中的預取請求
+}
+
+PACING = {
+    "INITIAL_RATE": 2.0,  # 每秒請求數，未有學習記錄時的起始速率
+    "MIN_RATE": 0.2,
+    "MAX_RATE": 5.0,
+    "ADDITIVE_INCREASE": 0.1,  # 每次健康回應增加的速率
+    "MULTIPLICATIVE_DECREASE": 0.5,  # 429、5xx 或回應過慢時速率乘以此值
+    "SLOW_RESPONSE": 3.0,  # 秒，超過視為伺服器吃力
+    "MAX_BACKOFF": 60,  # 秒，Retry-After 等待上限
+    "METRICS_WINDOW": 60,  # 秒，實際請求速率的統計窗口
+    "STATE_FILE": ".pacing_state.json",  # 各主機學到的速率
+    "SAVE_INTERVAL": 30  # 秒，保存速率的最短間隔
+}
+
+CIRCUIT_BREAKER = {
+    "WINDOW": 60,  # 秒，統計錯誤率的滑動窗口
+    "MIN_REQUESTS": 5,  # 窗口內至少有此數量的請求才會判斷是否熔斷
+    "ERROR_RATE": 0.5,  # 連接失敗、429、5xx 佔比達此值時熔斷
+    "SLOW_CALL": 8.0,  # 秒，超過視為慢回應
+    "SLOW_RATE": 0.8,  # 慢回應佔比達此值時熔斷
+    "OPEN_SECONDS": 30,  # 熔斷後的冷卻時間
+    "HALF_OPEN_PROBES": 1,  # 冷卻後允許的試探請求數
+    "MAX_INLINE_WAIT": 10  # 秒，Retry-After 超過此值時直接熔斷而非在請求內等待
+}
+
+NEGATIVE_CACHE = {
+    "ERROR_TTL": 60,  # 秒，請求失敗的帖子暫不重試
+    "EMPTY_TTL": 300,  # 秒，沒有回覆的帖子
+    "INVALID_TTL": 3600,  # 秒，已刪除或無權訪問的帖子
+    "MAX_ENTRIES": 10000,
+    "BLOOM_BITS": 1 << 20,  # 已知失效帖子的布隆過濾器大小（128KB）
+    "BLOOM_HASHES": 4,
+    "DEAD_ROTATE": 6 * 3600  # 秒，布隆過濾器輪替週期
+}
+
+HEDGING = {
+    "ENABLED": True,
+    "PERCENTILE": 0.95,  # 請求超過此延遲百分位仍未回應時發出對沖請求
+    "MIN_SAMPLES": 20,  # 延遲樣本不足時不對沖
+    "MIN_DELAY": 0.5,  # 秒，對沖前最少等待時間
+    "DECAY_AFTER": 1000  # 直方圖樣本達此數量時減半
+}
+
+TOPIC_SYNC = {
+    "DELTA": True,  # 帖子列表增量同步：只抓取水位線之後有更新的頁面
+    "FULL_RESYNC_INTERVAL": 600,  # 秒，定期完整同步以清除已刪除的帖子
+    "MAX_ITEMS": 600  # 每個分類帖子表保留的帖子上限
+}
+
+RANKING = {
+    "DEFAULT": "recency",  # 篩選條件未指定排序方式時使用的評分函數
+    "HOTNESS_MIN_AGE": 3600,  # 秒，計算回覆速度時帖子年齡的下限，避免新帖分數過度膨脹
+    "HOTNESS_UNKNOWN_AGE": 86400  # 秒，沒有發布時間的帖子按此年齡計算回覆速度
+}
+
+FILTER_KEYWORDS = {
+    # 篩選條件提及組名時，以整組關鍵字匹配帖子標題及回覆
+    "on9": ["on9", "搞笑", "荒謬", "無語", "惡搞", "迷因", "傻", "荒唐"]
+}
+
+REPLY_DEDUP = {
+    "ENABLED": True,  # 把近似重複的回覆（複製貼上、洗版）合併為一條並記錄數量
+    "SHINGLE": 2,  # SimHash 使用的字元 n-gram 長度
+    "MAX_DISTANCE": 7,  # 指紋漢明距離不超過此值視為近似重複，必須小於 BANDS
+    "BANDS": 8  # 指紋切分的段數，64 必須能被整除
+}
+
+RELEVANCE = {
+    "K1": 1.5,  # BM25 詞頻飽和參數
+    "B": 0.75,  # BM25 長度正規化參數
+    "MAX_REPLIES": 30  # 每個帖子按相關性保留的回覆上限（之後再按提示詞長度截斷）
+}
+
+SEARCH_INDEX = {
+    "ENABLED": True,  # 索引所有抓取到的帖子標題及回覆，「有冇人講過XXX」類問題先查本地索引
+    "PATH": ".search_index.sqlite3",
+    "MAX_RESULTS": 20,
+    "RETENTION_DAYS": 7,  # 超過此日數未再出現在帖子列表的帖子從索引中清除
+    "PRUNE_INTERVAL": 3600  # 秒，清除過期帖子的最短間隔
+}
+
+THREAD_METRICS = {
+    "RESOLUTION": 60,  # 秒，同一帖子在此間隔內的快照只保留最新一筆（降採樣）
+    "RETENTION": 6 * 3600,  # 秒，超過此時間的快照及不再出現的帖子會被清除
+    "INITIAL_ROWS": 4096,  # 快照陣列的初始容量
+    "MAX_ROWS": 262144,  # 快照陣列容量上限，已滿時丟棄最舊的一半
+    "VELOCITY_HALFLIFE": 1800,  # 秒，近期回覆速度的指數平滑半衰期
+    "MIN_INTERVAL": 10  # 秒，兩次快照間隔短於此值時不更新回覆速度
+}
+
 LIHKG_API = {
     "BASE_URL": "https://lihkg.com",
     "CATEGORIES": {
@@ -12,7 +137,7 @@ LIHKG_API = {
     },
     "MAX_PAGES": 3,
     "CACHE_DURATION": 60,
-    "REQUEST_DELAY": 0.5,
+    "STOP_ON_NO_NEW": True,  # 某頁沒有新帖子（全是翻頁期間被頂上的重複帖子）時停止翻頁
     "RATE_LIMIT": {
         "MAX_REQUESTS": 30,
         "PERIOD": 60
@@ -28,7 +153,7 @@ HKGOLDEN_API = {
     },
     "MAX_PAGES": 3,
     "CACHE_DURATION": 60,
-    "REQUEST_DELAY": 0.5,
+    "STOP_ON_NO_NEW": True,  # 某頁沒有新帖子（全是翻頁期間被頂上的重複帖子）時停止翻頁
     "RATE_LIMIT_WINDOW": 60,  # 秒，與 RATE_LIMIT["PERIOD"] 一致
     "RATE_LIMIT_REQUESTS": 30  # 與 RATE_LIMIT["MAX_REQUESTS"] 一致
 }
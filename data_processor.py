@@ -6,41 +6,213 @@ import time
 import random
 import uuid
 import traceback
+import inspect
+import sqlite3
+import numpy as np
 from datetime import datetime, timedelta
 import pytz
-import streamlit as st
 import streamlit.logger
-from threading import Lock
-from config import LIHKG_API, HKGOLDEN_API, GENERAL
+from config import LIHKG_API, HKGOLDEN_API, GENERAL, PREFETCH, TOPIC_SYNC, REPLY_DEDUP, RELEVANCE, SEARCH_INDEX
 from grok3_client import call_grok3_api
 from lihkg_api import get_lihkg_topic_list, get_lihkg_thread_content
 from hkgolden_api import get_hkgolden_topic_list, get_hkgolden_thread_content
-from utils import clean_html
+from reply_cleaner import clean_reply
+from near_duplicates import NearDuplicateIndex
+from records import ReplyExcerpt, ThreadData
+from reply_compression import reply_compressor
+from reply_spool import ReplySpool
+from session_cache import init_session_cache, get_fresh, shared_topic_cache, shared_thread_cache
+from async_runtime import session_state
+from singleflight import SingleFlight
+from stream_replay import ReplayableStream
+from circuit_breaker import CircuitOpenError
+from negative_cache import negative_cache, EMPTY, RATE_LIMITED
+from topic_table import topic_tables
+from thread_metrics import thread_metrics
+from search_index import search_index, search_terms
+from topic_store import TopicColumns
+from ranking import rank, scorer_for_condition, scorer_label
+from keyword_matcher import matcher_for_condition
+from relevance import BM25Index, query_tokens
 
 logger = streamlit.logger.get_logger(__name__)
-processing_lock = Lock()
-active_requests = {}
 MAX_PROMPT_LENGTH = GENERAL.get("MAX_PROMPT_LENGTH", 30000)
 THREAD_ID_CACHE_DURATION = 300
+QUESTION_DEDUP_TTL = 30
+question_flight = SingleFlight(ttl=QUESTION_DEDUP_TTL, name="question")
 HONG_KONG_TZ = pytz.timezone(GENERAL["TIMEZONE"])
 
 def clean_expired_cache(platform):
+    state = session_state()
     cache_duration = LIHKG_API["CACHE_DURATION"] if platform == "LIHKG" else HKGOLDEN_API["CACHE_DURATION"]
     current_time = time.time()
-    for cache_key in list(st.session_state.thread_content_cache.keys()):
-        if current_time - st.session_state.thread_content_cache[cache_key]["timestamp"] > cache_duration:
-            del st.session_state.thread_content_cache[cache_key]
-    for thread_id in list(st.session_state.thread_id_cache.keys()):
-        if current_time - st.session_state.thread_id_cache[thread_id]["timestamp"] > THREAD_ID_CACHE_DURATION:
-            del st.session_state.thread_id_cache[thread_id]
+    for cache_key in list(state.thread_content_cache.keys()):
+        if current_time - state.thread_content_cache.peek(cache_key)["timestamp"] > cache_duration:
+            del state.thread_content_cache[cache_key]
+    for thread_id in list(state.thread_id_cache.keys()):
+        if current_time - state.thread_id_cache.peek(thread_id)["timestamp"] > THREAD_ID_CACHE_DURATION:
+            del state.thread_id_cache[thread_id]
 
-def clean_reply_text(text):
-    text = re.sub(r'<img[^>]+alt="\[([^\]]+)\]"[^>]*>', r'[\1]', text)
-    text = clean_html(text)
-    text = ' '.join(text.split())
-    if len(text) <= 5:
-        return None
-    return text
+def _counters(state):
+    return {
+        "request_counter": state.get("request_counter", 0),
+        "last_reset": state.get("last_reset", time.time()),
+        "rate_limit_until": state.get("rate_limit_until", 0)
+    }
+
+def _stale_note(error, entry):
+    age = time.time() - entry["timestamp"]
+    logger.warning(f"Serving stale cache while circuit is open: host={error.host}, age={age:.0f}s")
+    return f"{error}；改用 {age:.0f} 秒前的緩存數據"
+
+async def fetch_topic_list(platform, cat_id, max_pages, state, refresh=False):
+    """抓取帖子列表，優先使用跨會話共享緩存（含背景預取結果），成功結果寫回共享緩存"""
+    cache_key = (platform, cat_id)
+    if not refresh:
+        entry = get_fresh(shared_topic_cache, cache_key, PREFETCH["MAX_AGE"])
+        if entry is not None and entry["pages"] >= max_pages:
+            logger.info(f"Shared topic cache hit: platform={platform}, cat_id={cat_id}, items={len(entry['data']['items'])}, age={time.time() - entry['timestamp']:.1f}s")
+            return dict(entry["data"], rate_limit_info=[], **_counters(state))
+    
+    fetch = get_lihkg_topic_list if platform == "LIHKG" else get_hkgolden_topic_list
+    platform_config = LIHKG_API if platform == "LIHKG" else HKGOLDEN_API
+    table = topic_tables.get(platform, cat_id)
+    # 增量同步：只翻頁到早於上次水位線的帖子為止，再合併到該分類的帖子表
+    delta = TOPIC_SYNC["DELTA"] and not table.needs_full_sync(max_pages)
+    try:
+        result = await fetch(
+            cat_id=cat_id,
+            sub_cat_id=0,
+            start_page=1,
+            max_pages=max_pages,
+            stop_on_no_new=platform_config["STOP_ON_NO_NEW"],
+            watermark=table.watermark if delta else None,
+            **_counters(state)
+        )
+    except CircuitOpenError as e:
+        entry = shared_topic_cache.peek(cache_key)
+        if entry is None:
+            raise
+        return dict(entry["data"], stale=True, rate_limit_info=[_stale_note(e, entry)], **_counters(state))
+    if result["items"]:
+        # 每次回應都記錄快照，供熱度排序計算近期回覆速度
+        thread_metrics.record(platform, result["items"])
+        if SEARCH_INDEX["ENABLED"]:
+            try:
+                await asyncio.to_thread(search_index.add_topics, platform, cat_id, result["items"])
+            except sqlite3.Error as e:
+                logger.error(f"Search index update failed: platform={platform}, cat_id={cat_id}, error={str(e)}")
+        if delta:
+            table.apply_delta(result["items"])
+        else:
+            table.replace(result["items"], max_pages)
+        result = dict(result, items=table.items())
+        shared_topic_cache[cache_key] = {
+            "data": {"items": result["items"]},
+            "pages": max_pages,
+            "timestamp": time.time()
+        }
+    return result
+
+async def fetch_thread_content(platform, thread_id, cat_id, max_replies, state, refresh=False):
+    """抓取帖子內容，共享緩存中已有足夠回覆時直接返回，成功結果寫回共享緩存"""
+    cache_key = (platform, thread_id)
+    if not refresh:
+        entry = get_fresh(shared_thread_cache, cache_key, PREFETCH["MAX_AGE"])
+        if entry is not None:
+            cached = entry["data"]
+            # 已緩存足夠回覆，或整個帖子的回覆都已緩存
+            if len(cached["replies"]) >= min(max_replies, cached["total_replies"] or max_replies):
+                logger.info(f"Shared thread cache hit: platform={platform}, thread_id={thread_id}, replies={len(cached['replies'])}")
+                # 壓縮存放的回覆在此才解壓（預取檢查只讀取長度及回覆總數）
+                return dict(cached, replies=cached["replies"][:max_replies], rate_limit_info=[], **_counters(state))
+    
+    negative = negative_cache.check(platform, thread_id)
+    if negative is not None:
+        logger.info(f"Negative cache hit, skipping request: platform={platform}, thread_id={thread_id}, reason={negative}")
+        return dict(replies=[], title=None, total_replies=0, thread_status=negative, rate_limit_info=[f"Skipped thread_id={thread_id}: {negative}"], **_counters(state))
+    
+    fetch = get_lihkg_thread_content if platform == "LIHKG" else get_hkgolden_thread_content
+    try:
+        result = await fetch(
+            thread_id=thread_id,
+            cat_id=cat_id,
+            max_replies=max_replies,
+            **_counters(state)
+        )
+    except CircuitOpenError as e:
+        entry = shared_thread_cache.peek(cache_key)
+        if entry is None:
+            raise
+        cached = entry["data"]
+        return dict(cached, replies=cached["replies"][:max_replies], stale=True, rate_limit_info=[_stale_note(e, entry)], **_counters(state))
+    thread_status = result.get("thread_status")
+    if thread_status is None and not result["replies"] and not result["rate_limit_info"]:
+        thread_status = EMPTY
+    if thread_status not in (None, RATE_LIMITED):
+        # 被限流的帖子不記錄，冷卻結束後可再次抓取
+        negative_cache.record(platform, thread_id, thread_status)
+    if isinstance(result["replies"], ReplySpool) and result["replies"].spilled:
+        # 已寫入臨時檔案的大帖子不放入記憶體中的共享緩存
+        logger.info(f"Skipping shared thread cache for spooled thread: platform={platform}, thread_id={thread_id}, replies={len(result['replies'])}")
+    elif result["replies"]:
+        # 緩存獨立的列表：調用方處理完後會關閉（清空）抓取返回的 ReplySpool
+        shared_thread_cache[cache_key] = {
+            "data": {
+                "replies": reply_compressor.compress(list(result["replies"])),
+                "title": result["title"],
+                "total_replies": result["total_replies"]
+            },
+            "timestamp": time.time()
+        }
+    if result["replies"] and SEARCH_INDEX["ENABLED"]:
+        # 已寫入臨時檔案的回覆同樣從 ReplySpool 逐批讀回索引
+        try:
+            await asyncio.to_thread(search_index.add_replies, platform, thread_id, result["replies"])
+        except sqlite3.Error as e:
+            logger.error(f"Search index update failed: platform={platform}, thread_id={thread_id}, error={str(e)}")
+    return result
+
+def select_replies(replies, query, thread_id=None) -> list:
+    """清理、去重並按與問題的相關性選出回覆，返回 ReplyExcerpt 列表
+
+    回覆逐條處理：候選內容存入 ReplySpool，BM25 只為查詢詞記錄倒排列表，近似重複次數記在去重索引中，
+    因此「全部回覆」的大帖子也只有少量固定大小的數據留在記憶體。
+    """
+    # 回覆內容已移除引用，引用關係以樓層號表示；只需記錄被引用回覆的樓層號，被引用的回覆不在已抓取範圍時以 post_id 表示
+    quoted = {reply.get("quote_post_id") for reply in replies if reply.get("quote_post_id")}
+    floors = {reply.get("post_id"): reply.get("msg_num") for reply in replies if reply.get("post_id") in quoted and reply.get("msg_num")}
+    candidates = ReplySpool(ReplyExcerpt)
+    # 近似重複的回覆（複製貼上、洗版）只保留第一條，重複次數在選出後記入 count
+    duplicates = NearDuplicateIndex() if REPLY_DEDUP["ENABLED"] else None
+    # 清理每條回覆時同步加入 BM25 索引，全部加入後只需一次查詢
+    relevance_index = BM25Index(vocabulary=query)
+    for reply in replies:
+        cleaned_text = clean_reply(reply["msg"])
+        if not cleaned_text:
+            continue
+        if duplicates is not None:
+            _, is_new = duplicates.add(cleaned_text)
+            if not is_new:
+                continue
+        quote_post_id = reply.get("quote_post_id")
+        candidates.append(ReplyExcerpt(
+            content=cleaned_text,
+            ref=f"#{reply['msg_num']}" if reply.get("msg_num") else None,
+            quote=(f"#{floors[quote_post_id]}" if quote_post_id in floors else f"post {quote_post_id}") if quote_post_id else None
+        ))
+        relevance_index.add(cleaned_text)
+    if duplicates is not None and duplicates.duplicates:
+        logger.info(f"Collapsed near-duplicate replies: thread_id={thread_id}, duplicates={duplicates.duplicates}, unique={len(duplicates)}")
+    # 與問題無關時分數全為 0，保持原本的回覆次序
+    valid_replies = []
+    for index in relevance_index.rank(query, RELEVANCE["MAX_REPLIES"]):
+        excerpt = candidates[index]
+        if duplicates is not None:
+            excerpt.count = duplicates.counts[index]
+        valid_replies.append(excerpt)
+    candidates.close()
+    return valid_replies
 
 async def analyze_user_question(question, platform):
     prompt = """
@@ -52,7 +224,7 @@ async def analyze_user_question(question, platform):
 2. 需要抓取哪些類型的數據？（例如：帖子標題、回覆數量、最後回覆時間、帖子點讚數、帖子負評數、回覆內容）
 3. 建議抓取的帖子數量（1-10個，根據問題需求明確指定，預設1個）？
 4. 建議抓取的回覆數量或閱讀策略？（例如：「全部回覆」「最多100條」「最新50條」「根據內容相關性選擇」「總結回覆意見」）
-5. 有無關鍵字或條件用於篩選帖子？（例如：包含特定詞語、按回覆數排序、按最後回覆時間排序）
+5. 有無關鍵字或條件用於篩選帖子？（例如：包含特定詞語、按回覆數排序、按最後回覆時間排序、按熱度排序、按點讚比例排序）
 
 回應格式：
 - 意圖: [描述]
@@ -130,6 +302,9 @@ async def analyze_user_question(question, platform):
         reply_strategy = "最新20條"
         filter_condition = "按回覆數量排序，標題或回覆包含‘on9’或搞笑、荒謬、惡搞、迷因、傻、無語、荒唐相關內容，優先今日帖子但允許最近三天"
     
+    if "熱度" in question_lower and "按熱度排序" not in filter_condition:
+        filter_condition = f"按熱度排序；{filter_condition}"
+    
     if "今日" in question_lower:
         filter_condition = f"{filter_condition}; 優先選擇今日發布的帖子，若無則放寬至最近七天"
     
@@ -141,23 +316,36 @@ async def analyze_user_question(question, platform):
         "filter_condition": filter_condition
     }
 
+def _share_result(result):
+    """把流式回應包裝為可重播的形式，供重複請求及緩存共用"""
+    if inspect.isasyncgen(result.get("response")):
+        result = dict(result, response=ReplayableStream(result["response"]))
+    return result
+
 async def process_user_question(question, platform, cat_id_map, selected_cat, return_prompt=False):
+    """處理用戶問題，相同請求共用一次處理結果
+
+    返回的 processed_data 為 ThreadData 列表：每個已選帖子一筆，replies 為選入提示詞的 ReplyExcerpt，
+    與提示詞共用同一份；不再是每條回覆一個 dict。
+    """
     request_key = f"{question}:{platform}:{selected_cat}:{'preview' if return_prompt else 'normal'}"
+    factory = lambda: _process_user_question(question, platform, cat_id_map, selected_cat, return_prompt, request_key)
+    result = await question_flight.do(request_key, factory, share=_share_result)
+    if getattr(result.get("response"), "failed", False):
+        # 共享的流式回應已中途失敗，不再重用，重新執行
+        logger.warning(f"Shared response stream failed, retrying: request_key={request_key}")
+        question_flight.forget(request_key)
+        result = await question_flight.do(request_key, factory, share=_share_result)
+    return dict(result)
+
+async def _process_user_question(question, platform, cat_id_map, selected_cat, return_prompt, request_key):
     current_time = time.time()
-    
-    with processing_lock:
-        if request_key in active_requests and current_time - active_requests[request_key]["timestamp"] < 30:
-            logger.warning(f"Skipping duplicate request: request_key={request_key}")
-            return active_requests[request_key]["result"]
-        
-        active_requests[request_key] = {"timestamp": current_time, "result": None}
+    state = session_state()
     
     logger.info(f"Starting to process question: request_key={request_key}, hk_time={datetime.now(HONG_KONG_TZ).strftime('%Y-%m-%d %H:%M:%S')}")
     
-    if "thread_id_cache" not in st.session_state:
-        st.session_state.thread_id_cache = {}
-    if "thread_content_cache" not in st.session_state:
-        st.session_state.thread_content_cache = {}
+    init_session_cache("thread_id_cache")
+    init_session_cache("thread_content_cache")
     
     clean_expired_cache(platform)
     
@@ -176,35 +364,38 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
             "processed_data": [],
             "analysis": analysis
         }
-        with processing_lock:
-            active_requests[request_key]["result"] = result
         return result
     
     max_pages = max(HKGOLDEN_API["MAX_PAGES"] if platform == "高登討論區" else LIHKG_API["MAX_PAGES"], analysis["num_threads"] // 10 + 1)
     logger.info(f"Fetching threads with reply_strategy={analysis['reply_strategy']}, cat_id={cat_id}")
     
+    # 搜尋類問題先查本地全文索引，有結果時直接以命中的帖子作為候選，不抓取帖子列表
+    terms = search_terms(question) if SEARCH_INDEX["ENABLED"] else None
+    index_hits = []
+    if terms:
+        try:
+            index_hits = await asyncio.to_thread(search_index.search_threads, platform, terms, cat_id)
+        except sqlite3.Error as e:
+            # 索引不可用時按一般流程抓取帖子列表
+            logger.error(f"Search index lookup failed, falling back to topic list: terms={terms}, error={str(e)}")
+        logger.info(f"Search index lookup: terms={terms}, cat_id={cat_id}, hits={len(index_hits)}")
+    
     start_fetch_time = time.time()
     try:
-        if platform == "LIHKG":
-            result = await get_lihkg_topic_list(
-                cat_id=cat_id,
-                sub_cat_id=0,
-                start_page=1,
-                max_pages=max_pages,
-                request_counter=st.session_state.get("request_counter", 0),
-                last_reset=st.session_state.get("last_reset", time.time()),
-                rate_limit_until=st.session_state.get("rate_limit_until", 0)
-            )
+        if index_hits:
+            result = dict(items=index_hits, rate_limit_info=[], **_counters(state))
         else:
-            result = await get_hkgolden_topic_list(
-                cat_id=cat_id,
-                sub_cat_id=0,
-                start_page=1,
-                max_pages=max_pages,
-                request_counter=st.session_state.get("request_counter", 0),
-                last_reset=st.session_state.get("last_reset", time.time()),
-                rate_limit_until=st.session_state.get("rate_limit_until", 0)
-            )
+            result = await fetch_topic_list(platform, cat_id, max_pages, state)
+    except CircuitOpenError as e:
+        # 熔斷中且沒有任何緩存可用，直接返回而不等待重試
+        logger.warning(f"Failing fast, circuit open and no cached topics: platform={platform}, cat_id={cat_id}, retry_in={e.retry_in:.0f}s")
+        result = {
+            "response": f"{e}。目前沒有 {platform}（{selected_cat}）的緩存數據，請稍後再試。",
+            "rate_limit_info": [str(e)],
+            "processed_data": [],
+            "analysis": analysis
+        }
+        return result
     except Exception as e:
         logger.error(f"Failed to fetch topics: platform={platform}, cat_id={cat_id}, error={str(e)}, traceback={traceback.format_exc()}")
         error_message = f"無法抓取帖子，API 錯誤：{str(e)}。"
@@ -216,15 +407,15 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
             "processed_data": [],
             "analysis": analysis
         }
-        with processing_lock:
-            active_requests[request_key]["result"] = result
         return result
     
     items = result["items"]
     rate_limit_info = result["rate_limit_info"]
-    st.session_state.request_counter = result["request_counter"]
-    st.session_state.last_reset = result["last_reset"]
-    st.session_state.rate_limit_until = result["rate_limit_until"]
+    # 熔斷期間改用緩存的帖子列表或內容時標記為過時數據
+    stale = result.get("stale", False)
+    state.request_counter = result["request_counter"]
+    state.last_reset = result["last_reset"]
+    state.rate_limit_until = result["rate_limit_until"]
     
     logger.info(f"Fetch completed: platform={platform}, category={selected_cat}, total_items={len(items)}, elapsed={time.time() - start_fetch_time:.2f}s")
     
@@ -239,65 +430,48 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
             "processed_data": [],
             "analysis": analysis
         }
-        with processing_lock:
-            active_requests[request_key]["result"] = result
         return result
     
-    selected_items = []
     filter_condition = analysis["filter_condition"].lower()
     today = datetime.now(HONG_KONG_TZ).date()
     seven_days_ago = today - timedelta(days=7)
     current_timestamp = int(time.time())
     one_year_ago = current_timestamp - 365 * 24 * 3600  # 2024 年
     
-    filtered_items = []
-    for item in items:
-        create_time = item.get("create_time", 0)
-        last_reply_time = item.get("last_reply_time", 0)
-        no_of_reply = item.get("no_of_reply", 0)
-        title = item.get("title", "").lower()
-        thread_id = item.get("id", item.get("thread_id", ""))
-        
-        try:
-            parsed_time = datetime.fromtimestamp(last_reply_time, tz=HONG_KONG_TZ).strftime('%Y-%m-%d %H:%M:%S')
-            logger.debug(f"Thread ID={thread_id}, title={title}, last_reply_time={last_reply_time}, parsed_time={parsed_time}")
-        except (ValueError, OSError) as e:
-            logger.warning(f"Invalid timestamp for thread ID={thread_id}: last_reply_time={last_reply_time}, error={str(e)}")
-            continue
-        
-        if last_reply_time < one_year_ago:
-            logger.warning(f"Thread ID={thread_id} filtered out: last_reply_time={parsed_time} is too old (before 2024)")
-            continue
-        if no_of_reply == 0:
-            logger.warning(f"Thread ID={thread_id} filtered out: no_of_reply=0")
-            continue
-        if "優先選擇今日發布的帖子" in filter_condition:
-            create_date = datetime.fromtimestamp(create_time, tz=HONG_KONG_TZ).date() if create_time else today
-            if create_date < seven_days_ago:
-                logger.debug(f"Thread ID={thread_id} filtered out: create_date={create_date} is older than 7 days")
-                continue
-        if "on9" in filter_condition and not ("on9" in title or any(kw in title for kw in ["搞笑", "荒謬", "無語", "惡搞", "迷因", "傻", "荒唐"])):
-            logger.debug(f"Thread ID={thread_id} filtered out: title does not match on9 keywords")
-            continue
-        
-        filtered_items.append(item)
-    
-    logger.info(f"Filtered {len(filtered_items)} threads after applying conditions")
-    
-    if "按回覆數量排序" in filter_condition:
-        selected_items = sorted(
-            filtered_items,
-            key=lambda x: (x.get("no_of_reply", 0), x.get("last_reply_time", 0)),
-            reverse=True
-        )
+    # 以列式存儲做向量化篩選，避免逐個帖子格式化時間和匹配關鍵字
+    store = TopicColumns(items, id_key="thread_id" if platform == "LIHKG" else "id", platform=platform)
+    filters = [
+        ("last_reply_time too old (before 2024)", store.replied_since(one_year_ago)),
+        ("no_of_reply=0", store.has_replies())
+    ]
+    if "優先選擇今日發布的帖子" in filter_condition:
+        seven_days_ago_ts = HONG_KONG_TZ.localize(datetime.combine(seven_days_ago, datetime.min.time())).timestamp()
+        filters.append(("create_date older than 7 days", store.created_since(seven_days_ago_ts)))
+    # 篩選條件中的關鍵字編譯為一個多關鍵字匹配器，標題及回覆都只需掃描一遍
+    keyword_matcher = matcher_for_condition(filter_condition)
+    if keyword_matcher and not index_hits:
+        filters.append((f"title does not match keywords {list(keyword_matcher.keywords)}", store.title_matches(keyword_matcher)))
+    mask = store.all()
+    for reason, condition in filters:
+        filtered_out = int(np.count_nonzero(mask & ~condition))
+        if filtered_out:
+            logger.debug(f"{filtered_out} threads filtered out: {reason}")
+        mask &= condition
+    mask = store.exclude(mask, lambda thread_id: negative_cache.check(platform, thread_id) is not None)
+    
+    logger.info(f"Filtered {int(np.count_nonzero(mask))} threads after applying conditions")
+    
+    ranking = scorer_for_condition(filter_condition)
+    # 回覆按與用戶問題及篩選關鍵字的 BM25 相關性排序
+    relevance_query = query_tokens(question, keyword_matcher.keywords)
+    if index_hits:
+        # 索引命中的帖子已按相關性排序
+        ranking_label = "搜尋相關性"
+        selected_items = store.take(np.flatnonzero(mask)[:analysis["num_threads"]])
     else:
-        selected_items = sorted(
-            filtered_items,
-            key=lambda x: x.get("last_reply_time", 0),
-            reverse=True
-        )
-    
-    selected_items = selected_items[:analysis["num_threads"]]
+        ranking_label = scorer_label(ranking)
+        selected_items = store.take(rank(store, mask, analysis["num_threads"], by=ranking))
+    logger.info(f"Ranked threads by {ranking_label}: selected={len(selected_items)}")
     
     if not selected_items:
         logger.error("No threads match filter conditions")
@@ -313,14 +487,13 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
             "processed_data": [],
             "analysis": analysis
         }
-        with processing_lock:
-            active_requests[request_key]["result"] = result
         return result
     
     logger.info(f"Selected {len(selected_items)} threads: {[item.get('id') for item in selected_items]}")
     
-    processed_data = []
     threads_data = []
+    # 處理結果直接引用已選帖子的記錄，不再按回覆另外複製一份
+    processed_data = threads_data
     valid_threads = 0
     
     for selected_item in selected_items:
@@ -337,105 +510,81 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
         
         replies = []
         total_replies = no_of_reply
+        thread_data = None
         if analysis["reply_strategy"] != "無需抓取回覆內容":
-            use_cache = thread_id in st.session_state.thread_id_cache and \
-                        current_time - st.session_state.thread_id_cache[thread_id]["timestamp"] < THREAD_ID_CACHE_DURATION
+            use_cache = thread_id in state.thread_id_cache and \
+                        current_time - state.thread_id_cache[thread_id]["timestamp"] < THREAD_ID_CACHE_DURATION
             if use_cache:
                 logger.info(f"Using thread ID cache: thread_id={thread_id}")
-                thread_data = st.session_state.thread_id_cache[thread_id]["data"]
-                replies = thread_data["replies"]
-                thread_title = thread_data["title"]
-                total_replies = thread_data["total_replies"]
-                rate_limit_info.extend(thread_data.get("rate_limit_info", []))
+                cached_data = state.thread_id_cache[thread_id]["data"]
+                replies = cached_data["replies"]
+                thread_title = cached_data["title"]
+                total_replies = cached_data["total_replies"]
+                rate_limit_info.extend(cached_data.get("rate_limit_info", []))
             else:
                 thread_max_replies = min(no_of_reply, 10) if "最新10條" in analysis["reply_strategy"] else \
                                     min(no_of_reply, 50) if "最新50條" in analysis["reply_strategy"] else no_of_reply
                 logger.info(f"Fetching thread content: thread_id={thread_id}, platform={platform}, max_replies={thread_max_replies}")
                 
                 try:
-                    if platform == "LIHKG":
-                        thread_result = await get_lihkg_thread_content(
-                            thread_id=thread_id,
-                            cat_id=cat_id,
-                            request_counter=st.session_state.request_counter,
-                            last_reset=st.session_state.last_reset,
-                            rate_limit_until=st.session_state.rate_limit_until,
-                            max_replies=thread_max_replies
-                        )
-                    else:
-                        thread_result = await get_hkgolden_thread_content(
-                            thread_id=thread_id,
-                            cat_id=cat_id,
-                            request_counter=st.session_state.request_counter,
-                            last_reset=st.session_state.last_reset,
-                            rate_limit_until=st.session_state.rate_limit_until,
-                            max_replies=thread_max_replies
-                        )
+                    thread_result = await fetch_thread_content(platform, thread_id, selected_item.get("cat_id") or cat_id, thread_max_replies, state)
                 except Exception as e:
                     logger.error(f"Failed to fetch thread content: thread_id={thread_id}, error={str(e)}, traceback={traceback.format_exc()}")
                     rate_limit_info.append(f"Thread fetch failed: thread_id={thread_id}, error={str(e)}")
                     continue
                 
+                stale = stale or thread_result.get("stale", False)
                 replies = thread_result["replies"]
                 thread_title = thread_result["title"] or thread_title
                 total_replies = thread_result.get("total_replies", no_of_reply)
                 rate_limit_info.extend(thread_result["rate_limit_info"])
-                st.session_state.request_counter = thread_result["request_counter"]
-                st.session_state.last_reset = thread_result["last_reset"]
-                st.session_state.rate_limit_until = thread_result["rate_limit_until"]
+                state.request_counter = thread_result["request_counter"]
+                state.last_reset = thread_result["last_reset"]
+                state.rate_limit_until = thread_result["rate_limit_until"]
                 
                 logger.info(f"Thread content fetched: thread_id={thread_id}, title={thread_title}, replies={len(replies)}")
                 
-                valid_replies = []
-                for reply in replies:
-                    cleaned_text = clean_reply_text(reply["msg"])
-                    if cleaned_text:
-                        if len(valid_replies) < 5 or any(kw in cleaned_text.lower() for kw in ["on9", "搞笑", "荒謬", "無語", "惡搞", "迷因", "傻", "荒唐"]):
-                            valid_replies.append({"content": cleaned_text})
+                valid_replies = select_replies(replies, relevance_query, thread_id)
+                if isinstance(replies, ReplySpool):
+                    replies.close()
                 
                 if not valid_replies:
                     logger.warning(f"No valid replies for thread_id={thread_id}, skipping thread")
                     rate_limit_info.append(f"No valid replies for thread_id={thread_id}")
                     continue
                 
-                thread_data = {
-                    "thread_id": thread_id,
-                    "title": thread_title,
-                    "no_of_reply": no_of_reply,
-                    "last_reply_time": last_reply_time,
-                    "like_count": selected_item.get("like_count", 0),
-                    "dislike_count": selected_item.get("dislike_count", 0),
-                    "total_replies": total_replies,
-                    "replies": valid_replies,
-                    "rate_limit_info": thread_result["rate_limit_info"],
-                    "timestamp": current_time
-                }
-                st.session_state.thread_id_cache[thread_id] = {
+                thread_data = ThreadData(
+                    thread_id=thread_id,
+                    title=thread_title,
+                    no_of_reply=no_of_reply,
+                    last_reply_time=last_reply_time,
+                    like_count=selected_item.get("like_count", 0),
+                    dislike_count=selected_item.get("dislike_count", 0),
+                    total_replies=total_replies,
+                    replies=valid_replies,
+                    rate_limit_info=thread_result["rate_limit_info"],
+                    timestamp=current_time
+                )
+                state.thread_id_cache[thread_id] = {
                     "data": thread_data,
                     "timestamp": current_time
                 }
                 replies = valid_replies
         
         valid_threads += 1
-        threads_data.append({
-            "thread_id": thread_id,
-            "title": thread_title,
-            "no_of_reply": no_of_reply,
-            "last_reply_time": last_reply_time,
-            "like_count": selected_item.get("like_count", 0),
-            "dislike_count": selected_item.get("dislike_count", 0),
-            "total_replies": total_replies,
-            "replies": replies
-        })
-        
-        processed_data.extend([
-            {
-                "thread_id": thread_id,
-                "title": thread_title,
-                "content": reply["content"]
-            }
-            for reply in replies
-        ])
+        if thread_data is None:
+            # 使用會話緩存的回覆或無需回覆時，以目前的帖子元數據建立記錄，回覆列表共用而不複製
+            thread_data = ThreadData(
+                thread_id=thread_id,
+                title=thread_title,
+                no_of_reply=no_of_reply,
+                last_reply_time=last_reply_time,
+                like_count=selected_item.get("like_count", 0),
+                dislike_count=selected_item.get("dislike_count", 0),
+                total_replies=total_replies,
+                replies=replies
+            )
+        threads_data.append(thread_data)
     
     if valid_threads == 0:
         logger.error("No valid threads with replies found")
@@ -451,8 +600,6 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
             "processed_data": [],
             "analysis": analysis
         }
-        with processing_lock:
-            active_requests[request_key]["result"] = result
         return result
     
     prompt_length = 0
@@ -468,6 +615,8 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
     prompt.append(f"- 帖子數量：{min(analysis['num_threads'], valid_threads)}")
     prompt.append(f"- 回覆策略：{analysis['reply_strategy']}")
     prompt.append(f"- 篩選條件：{analysis['filter_condition']}")
+    if stale:
+        prompt.append(f"注意：{platform} 暫時無法連接，以下帖子數據來自較早前的緩存，可能不是最新，請在分享文字開頭註明。")
     prompt.append("\n帖子數據：")
     
     for thread in threads_data:
@@ -484,12 +633,15 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
         prompt.extend(thread_info)
         
         if thread["replies"]:
-            prompt.append(f"- 回覆（共 {len(thread['replies'])} 條，篩選後保留相關內容）：")
+            prompt.append(f"- 回覆（共 {len(thread['replies'])} 條，篩選後保留相關內容；引用的舊回覆已移除，「回應 #n」表示引用第 n 樓，「（×n）」表示共有 n 條相近回覆）：")
             max_replies = len(thread["replies"])
             reply_count = 0
             for reply in thread["replies"]:
                 content = reply["content"][:100] + '...' if len(reply["content"]) > 100 else reply["content"]
-                reply_line = f"  - {content}"
+                ref = f"{reply['ref']} " if reply.get("ref") else ""
+                quote = f"（回應 {reply['quote']}）" if reply.get("quote") else ""
+                repeated = f"（×{reply['count']}）" if reply.get("count", 1) > 1 else ""
+                reply_line = f"  - {ref}{quote}{content}{repeated}"
                 if len(''.join(prompt)) + len(reply_line) > MAX_PROMPT_LENGTH:
                     break
                 prompt.append(reply_line)
@@ -500,7 +652,7 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
             prompt.append("- 回覆：無（未找到符合條件的回覆或內容抓取失敗）")
     
     prompt.append("\n請完成以下任務：")
-    prompt.append(f"1. 生成一段簡潔的分享或排列文字，嚴格限制在 {share_text_limit} 字以內，列出 {min(analysis['num_threads'], valid_threads)} 個帖子，按最後回覆時間降序排列，包含每個帖子的標題、回覆數量、最後回覆時間、點讚數和負評數。若有回覆內容，綜合不同回覆的意見，總結主要觀點、情緒或熱門話題（若有回覆），而非僅引用單一回覆。若無回覆內容，僅列出帖子元數據（標題、回覆數等），並註明「無可用回覆」。")
+    prompt.append(f"1. 生成一段簡潔的分享或排列文字，嚴格限制在 {share_text_limit} 字以內，列出 {min(analysis['num_threads'], valid_threads)} 個帖子，按{ranking_label}降序排列，包含每個帖子的標題、回覆數量、最後回覆時間、點讚數和負評數。若有回覆內容，綜合不同回覆的意見，總結主要觀點、情緒或熱門話題（若有回覆），而非僅引用單一回覆。若無回覆內容，僅列出帖子元數據（標題、回覆數等），並註明「無可用回覆」。")
     prompt.append(f"2. 提供一段簡短的選擇理由（{reason_limit} 字以內），解釋為何選擇這些帖子（例如話題性、最新性、回覆數量多等）。")
     prompt.append(f"3. 若回覆數量過多，根據回覆策略（{analysis['reply_strategy']}）優先總結最新或最相關的回覆內容。")
     prompt.append("4. 嚴禁生成假數據或虛構內容，所有信息必須基於提供的帖子數據。")
@@ -519,10 +671,9 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
             "response": prompt,
             "rate_limit_info": rate_limit_info,
             "processed_data": processed_data,
-            "analysis": analysis
+            "analysis": analysis,
+            "stale": stale
         }
-        with processing_lock:
-            active_requests[request_key]["result"] = result
         return result
     
     async def stream_response(max_retries=3):
@@ -616,14 +767,10 @@ async def process_user_question(question, platform, cat_id_map, selected_cat, re
         "response": stream_response(),
         "rate_limit_info": rate_limit_info,
         "processed_data": processed_data,
-        "analysis": analysis
+        "analysis": analysis,
+        "stale": stale
     }
     
-    with processing_lock:
-        active_requests[request_key]["result"] = result
-        if current_time - active_requests[request_key]["timestamp"] > 30:
-            del active_requests[request_key]
-    
     logger.info(f"Processed question: question={question}, platform={platform}, hk_time={datetime.now(HONG_KONG_TZ).strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info(f"Selected {len(selected_items)} threads, total replies fetched: {sum(len(thread['replies']) for thread in threads_data)}")
     
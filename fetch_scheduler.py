@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import time
+from collections import deque
+import streamlit.logger
+from config import LIHKG_API, HKGOLDEN_API, PREFETCH, SCHEDULER
+
+logger = streamlit.logger.get_logger(__name__)
+
+# 優先級：數字越小越優先
+INTERACTIVE = 0
+PREFETCH_PRIORITY = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", PREFETCH_PRIORITY: "prefetch", BULK: "bulk"}
+
+_priority = contextvars.ContextVar("fetch_priority", default=INTERACTIVE)
+
+class FetchPreempted(Exception):
+    """排隊中的低優先級請求被互動請求搶佔"""
+
+@contextlib.contextmanager
+def fetch_priority(priority: int):
+    """在此範圍內發出的論壇請求使用指定優先級（按協程上下文生效）"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+async def with_priority(priority: int, awaitable):
+    """以指定優先級執行協程；經 runtime.run 提交到背景事件循環的協程不會繼承調用方的上下文，需在協程內設定"""
+    with fetch_priority(priority):
+        return await awaitable
+
+def current_priority() -> int:
+    return _priority.get()
+
+class _PlatformBudget:
+    def __init__(self, platform: str, max_requests: int, period: float, shares: dict):
+        self.platform = platform
+        self.max_requests = max_requests
+        self.period = period
+        # 背景類別在一個時間窗口內最多可使用的請求數
+        self.class_limits = {
+            priority: max(1, int(max_requests * share)) for priority, share in shares.items()
+        }
+        self.grants = deque()
+        self.queue = []
+        self.wakeup = asyncio.Event()
+        self.dispatcher = None
+        self.stats = {name: {"granted": 0, "waited": 0.0, "preempted": 0, "cancelled": 0} for name in PRIORITY_NAMES.values()}
+
+    def _purge(self, now: float):
+        while self.grants and now - self.grants[0][0] >= self.period:
+            self.grants.popleft()
+
+    def wait_time(self, priority: int, now: float) -> float:
+        """返回該優先級還需等待的秒數，0 表示可立即發出"""
+        self._purge(now)
+        if len(self.grants) >= self.max_requests:
+            return self.grants[0][0] + self.period - now
+        limit = self.class_limits.get(priority)
+        if limit is not None:
+            used = [t for t, p in self.grants if p == priority]
+            if len(used) >= limit:
+                return used[0] + self.period - now
+        return 0.0
+
+    def grant(self, priority: int, now: float):
+        self.grants.append((now, priority))
+        self.stats[PRIORITY_NAMES[priority]]["granted"] += 1
+
+class FetchScheduler:
+    """所有論壇請求共用的中央排程器：按優先級及各平台預算發放請求配額"""
+
+    def __init__(self, budgets: dict, shares: dict, preempt_prefetch: bool = True):
+        self._config = budgets
+        self._shares = shares
+        self.preempt_prefetch = preempt_prefetch
+        self._budgets = {}
+        self._seq = itertools.count()
+
+    def _budget(self, platform: str) -> _PlatformBudget:
+        budget = self._budgets.get(platform)
+        if budget is None:
+            max_requests, period = self._config[platform]
+            budget = _PlatformBudget(platform, max_requests, period, self._shares)
+            self._budgets[platform] = budget
+        return budget
+
+    async def acquire(self, platform: str, context: dict = None):
+        """等待直至可向該平台發出一個請求；優先級取自 fetch_priority() 上下文"""
+        priority = _priority.get()
+        budget = self._budget(platform)
+        start = time.time()
+        if not budget.queue and budget.wait_time(priority, start) == 0:
+            budget.grant(priority, start)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), waiter, context]
+        heapq.heappush(budget.queue, entry)
+        if priority == INTERACTIVE and self.preempt_prefetch:
+            self._preempt(budget)
+        if budget.dispatcher is None or budget.dispatcher.done():
+            budget.dispatcher = asyncio.ensure_future(self._dispatch(budget))
+        budget.wakeup.set()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # 用戶放棄問題（協程被取消）時從隊列移除，不佔用配額
+            if waiter.cancelled():
+                entry[2] = None
+                budget.stats[PRIORITY_NAMES[priority]]["cancelled"] += 1
+            raise
+        waited = time.time() - start
+        budget.stats[PRIORITY_NAMES[priority]]["waited"] += waited
+        context_info = f", 上下文={context}" if context else ""
+        logger.info(f"Fetch slot granted after {waited:.2f}s: platform={platform}, priority={PRIORITY_NAMES[priority]}{context_info}")
+
+    def try_acquire(self, platform: str, context: dict = None) -> bool:
+        """可立即發出請求時佔用配額並返回 True，否則不排隊直接返回 False"""
+        priority = _priority.get()
+        budget = self._budget(platform)
+        now = time.time()
+        if budget.queue or budget.wait_time(priority, now) > 0:
+            return False
+        budget.grant(priority, now)
+        context_info = f", 上下文={context}" if context else ""
+        logger.info(f"Fetch slot granted immediately: platform={platform}, priority={PRIORITY_NAMES[priority]}{context_info}")
+        return True
+
+    def _preempt(self, budget: _PlatformBudget):
+        for entry in budget.queue:
+            if entry[0] == PREFETCH_PRIORITY and entry[2] is not None and not entry[2].done():
+                entry[2].set_exception(FetchPreempted(f"Prefetch request preempted by interactive request on {budget.platform}"))
+                entry[2] = None
+                budget.stats["prefetch"]["preempted"] += 1
+
+    async def _dispatch(self, budget: _PlatformBudget):
+        while budget.queue:
+            budget.wakeup.clear()
+            entry = budget.queue[0]
+            if entry[2] is None or entry[2].done():
+                heapq.heappop(budget.queue)
+                continue
+            now = time.time()
+            delay = budget.wait_time(entry[0], now)
+            if delay <= 0:
+                heapq.heappop(budget.queue)
+                budget.grant(entry[0], now)
+                entry[2].set_result(None)
+                continue
+            # 有新的請求加入時提前醒來，重新檢查隊首
+            try:
+                await asyncio.wait_for(budget.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            platform: {
+                "queued": sum(1 for entry in budget.queue if entry[2] is not None),
+                "in_window": len(budget.grants),
+                "max_requests": budget.max_requests,
+                "classes": budget.stats
+            }
+            for platform, budget in self._budgets.items()
+        }
+
+fetch_scheduler = FetchScheduler(
+    budgets={
+        "LIHKG": (LIHKG_API["RATE_LIMIT"]["MAX_REQUESTS"], LIHKG_API["RATE_LIMIT"]["PERIOD"]),
+        "高登討論區": (HKGOLDEN_API["RATE_LIMIT_REQUESTS"], HKGOLDEN_API["RATE_LIMIT_WINDOW"])
+    },
+    shares={
+        PREFETCH_PRIORITY: PREFETCH["BUDGET_SHARE"],
+        BULK: SCHEDULER["BULK_SHARE"]
+    },
+    preempt_prefetch=SCHEDULER["PREEMPT_PREFETCH"]
+)
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import aiohttp
+import streamlit.logger
+from singleflight import SingleFlight
+from fetch_scheduler import fetch_scheduler, current_priority, FetchPreempted, PREFETCH_PRIORITY
+from pacing import get_pacer, parse_retry_after
+from circuit_breaker import get_breaker
+from hedging import hedged, hedge_policy
+
+logger = streamlit.logger.get_logger(__name__)
+
+# 只合併進行中的請求：完成後立即失效，下一次請求重新抓取
+page_flight = SingleFlight(ttl=0, name="page")
+
+async def _send(session, url, headers, params, host):
+    request_start = time.time()
+    async with session.get(url, headers=headers, params=params, timeout=10) as response:
+        result = {
+            "status": response.status,
+            "data": None,
+            "text": None,
+            "content_type": response.content_type,
+            "retry_after": parse_retry_after(response.headers.get("Retry-After"))
+        }
+        if response.status == 200:
+            try:
+                result["data"] = await response.json()
+            except aiohttp.ContentTypeError:
+                pass
+        elif response.status != 429:
+            try:
+                result["text"] = (await response.text())[:200]
+            except Exception as e:
+                result["text"] = f"Failed to read error response: {str(e)}"
+    hedge_policy.record_request(host, time.time() - request_start)
+    return result
+
+async def _request(platform, session, url, headers, params, context):
+    breaker = get_breaker(url)
+    pacer = get_pacer(url)
+    # 熔斷中直接拋出 CircuitOpenError，不佔用排程配額
+    breaker.check()
+    await fetch_scheduler.acquire(platform, context=context)
+    await pacer.wait()
+    # 排程及節奏控制放行後才佔用試探名額，排隊期間被取消或搶佔不會卡住半開狀態
+    probe = breaker.before_request()
+    request_start = time.time()
+    recorded = False
+    try:
+        try:
+            # 慢請求在預算許可時對沖：第二個請求只在排程器可立即發放配額時發出
+            result = await hedged(
+                breaker.host,
+                lambda: _send(session, url, headers, params, breaker.host),
+                lambda: fetch_scheduler.try_acquire(platform, context=dict(context or {}, hedge=True))
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            recorded = True
+            breaker.record(None, time.time() - request_start)
+            raise
+        latency = time.time() - request_start
+        hedge_policy.record_observed(breaker.host, latency)
+        retry_after = result.pop("retry_after")
+        # 由節奏控制器按回應調整速率；429 時返回 Retry-After 的冷卻時間，下次 pacer.wait() 會等到冷卻結束
+        result["wait_time"] = pacer.record(result["status"], latency, retry_after)
+        result["latency"] = latency
+        recorded = True
+        breaker.record(result["status"], latency, retry_after)
+        return result
+    finally:
+        if not recorded:
+            # 取消、搶佔或其他錯誤：沒有可記錄的結果，歸還試探名額
+            breaker.release(probe)
+
+async def fetch_page(platform, session, url, headers, params=None, context=None) -> dict:
+    """抓取一頁論壇 API 並解析 JSON；跨會話的相同請求（平台、網址、參數）共用同一次抓取
+
+    返回 status、data（JSON，非 200 或非 JSON 時為 None）、text（錯誤回應內容）、
+    content_type、latency 及 wait_time（429 時的冷卻秒數）。
+    """
+    key = (platform, url, tuple(sorted(params.items())) if params else ())
+    while True:
+        try:
+            return await page_flight.do(key, lambda: _request(platform, session, url, headers, params, context))
+        except FetchPreempted:
+            # 共用的請求由預取發起而被搶佔時，非預取的調用方自行重新發起
+            if current_priority() == PREFETCH_PRIORITY:
+                raise
+            logger.info(f"Coalesced prefetch request was preempted, retrying: platform={platform}, url={url}")
+
+def coalescing_stats() -> dict:
+    """返回合併統計：coalesced 為共用他人抓取結果而省下的請求數"""
+    stats = page_flight.stats()
+    return {
+        "requests": stats["leaders"],
+        "coalesced": stats["inflight_hits"],
+        "saved_ratio": stats["hit_rate"],
+        "inflight": stats["inflight"]
+    }
@@ -0,0 +1,143 @@
+import asyncio
+import bisect
+import threading
+import streamlit.logger
+from config import HEDGING
+
+logger = streamlit.logger.get_logger(__name__)
+
+# 直方圖桶上限（秒），按對數間隔分佈；最後一桶收集所有更慢的請求
+BUCKETS = [0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, float("inf")]
+
+class LatencyHistogram:
+    """固定桶的延遲直方圖；樣本過多時整體減半，讓百分位跟隨近期延遲變化"""
+
+    def __init__(self, decay_after: int = HEDGING["DECAY_AFTER"]):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.decay_after = decay_after
+
+    def record(self, latency: float):
+        self.counts[bisect.bisect_left(BUCKETS, latency)] += 1
+        self.total += 1
+        if self.total >= self.decay_after:
+            self.counts = [count // 2 for count in self.counts]
+            self.total = sum(self.counts)
+
+    def percentile(self, p: float) -> float:
+        """返回第 p 百分位所在桶的上限；沒有樣本時返回 None"""
+        if not self.total:
+            return None
+        target = p * self.total
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return BUCKETS[-1]
+
+    def snapshot(self) -> dict:
+        return {
+            "samples": self.total,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99)
+        }
+
+class HedgePolicy:
+    """按主機記錄請求延遲，決定何時對慢請求發出第二個相同請求"""
+
+    def __init__(self, config: dict = HEDGING):
+        self.enabled = config["ENABLED"]
+        self.percentile = config["PERCENTILE"]
+        self.min_samples = config["MIN_SAMPLES"]
+        self.min_delay = config["MIN_DELAY"]
+        self._lock = threading.Lock()
+        # request：每個實際發出的請求；observed：調用方實際等待的時間（含對沖效果）
+        self._hosts = {}
+
+    def _host(self, host: str) -> dict:
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                entry = {
+                    "request": LatencyHistogram(),
+                    "observed": LatencyHistogram(),
+                    "stats": {"hedged": 0, "hedge_wins": 0, "skipped_no_budget": 0}
+                }
+                self._hosts[host] = entry
+            return entry
+
+    def delay(self, host: str) -> float:
+        """返回發出對沖請求前的等待秒數；未啟用或樣本不足時返回 None"""
+        if not self.enabled:
+            return None
+        histogram = self._host(host)["request"]
+        if histogram.total < self.min_samples:
+            return None
+        threshold = histogram.percentile(self.percentile)
+        if threshold == float("inf"):
+            return None
+        return max(self.min_delay, threshold)
+
+    def record_request(self, host: str, latency: float):
+        self._host(host)["request"].record(latency)
+
+    def record_observed(self, host: str, latency: float):
+        self._host(host)["observed"].record(latency)
+
+    def count(self, host: str, stat: str):
+        self._host(host)["stats"][stat] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {
+            host: dict(
+                entry["stats"],
+                threshold=self.delay(host),
+                request=entry["request"].snapshot(),
+                observed=entry["observed"].snapshot()
+            )
+            for host, entry in hosts.items()
+        }
+
+hedge_policy = HedgePolicy()
+
+async def hedged(host: str, send, has_budget):
+    """執行 send()；若超過延遲閾值仍未完成且 has_budget() 為真，再發出一個相同請求，先完成者勝出"""
+    delay = hedge_policy.delay(host)
+    if delay is None:
+        return await send()
+    primary = asyncio.ensure_future(send())
+    pending = {primary}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+        if not has_budget():
+            hedge_policy.count(host, "skipped_no_budget")
+            return await primary
+        hedge_policy.count(host, "hedged")
+        logger.info(f"Hedging slow request: host={host}, threshold={delay:.2f}s")
+        hedge = asyncio.ensure_future(send())
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # 被取消的請求（例如從外部取消）沒有結果也沒有例外，task.exception() 會拋出 CancelledError
+                if task.cancelled():
+                    continue
+                if task.exception() is None:
+                    if task is hedge:
+                        hedge_policy.count(host, "hedge_wins")
+                    return task.result()
+                error = error or task.exception()
+        if error is None:
+            raise asyncio.CancelledError()
+        raise error
+    finally:
+        # 勝出後或調用方被取消時，取消仍在進行的請求
+        for task in pending:
+            task.cancel()
@@ -2,12 +2,17 @@ import aiohttp
 import asyncio
 import streamlit.logger
 import time
-import traceback
 import hashlib
 import uuid
 import random
 from datetime import datetime
 from config import HKGOLDEN_API
+from async_runtime import http_session
+from forum_http import fetch_page
+from topic_merge import TopicMerger
+from reply_cleaner import strip_quotes
+from records import TopicItem, Reply
+from reply_spool import ReplySpool
 
 logger = streamlit.logger.get_logger(__name__)
 
@@ -34,28 +39,31 @@ def get_api_topic_details_key(thread_id: int, page: int, user_id: str = "%GUEST%
     return hashlib.md5(f"{date_string}_HKGOLDEN_{user_id}_$API#Android_1_2^{thread_id}_{start}_{filter_mode}_N".encode()).hexdigest()
 
 async def fetch_with_retry(session, url, headers, params, retries=3, backoff_factor=1):
+    status = 500
     for attempt in range(retries):
         try:
-            async with session.get(url, headers=headers, params=params, timeout=10) as response:
-                if response.status == 429:
-                    retry_after = int(response.headers.get("Retry-After", 60))
-                    logger.warning(f"Rate limit hit for {url}, retrying after {retry_after}s")
-                    await asyncio.sleep(retry_after)
-                    continue
-                response.raise_for_status()
-                data = await response.json()
-                logger.debug(f"Raw response from {url}: {data}")
-                return data, response.status
+            page_response = await fetch_page("高登討論區", session, url, headers, params=params, context={"url": url, "attempt": attempt + 1})
+            status = page_response["status"]
+            if status == 429:
+                # 冷卻時間由 pacer 記錄，下一次嘗試的 pacer.wait() 會等到冷卻結束
+                logger.warning(f"Rate limit hit for {url}, retrying after {page_response['wait_time']:.2f}s")
+                continue
+            if page_response["data"] is not None:
+                logger.debug(f"Raw response from {url}: {page_response['data']}")
+                return page_response["data"], status
+            error = f"status={status}, content_type={page_response['content_type']}, body={page_response['text']}"
         except (aiohttp.ClientResponseError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
-            logger.warning(f"Attempt {attempt + 1}/{retries} failed for {url}: {str(e)}")
-            if attempt < retries - 1:
-                await asyncio.sleep(backoff_factor * (2 ** attempt))
-            else:
-                logger.error(f"All {retries} attempts failed for {url}: {str(e)}, traceback={traceback.format_exc()}")
-                return None, response.status if 'response' in locals() else 500
-    return None, 500
+            error = str(e)
+        logger.warning(f"Attempt {attempt + 1}/{retries} failed for {url}: {error}")
+        if attempt < retries - 1:
+            await asyncio.sleep(backoff_factor * (2 ** attempt))
+        else:
+            logger.error(f"All {retries} attempts failed for {url}: {error}")
+            return None, status
+    # 每次嘗試都被限流：返回 429，由調用方區分於一般失敗
+    return None, status
 
-async def get_hkgolden_topic_list(cat_id, sub_cat_id, start_page, max_pages, request_counter, last_reset, rate_limit_until):
+async def get_hkgolden_topic_list(cat_id, sub_cat_id, start_page, max_pages, request_counter, last_reset, rate_limit_until, stop_on_no_new=False, watermark=None):
     if time.time() < rate_limit_until:
         logger.warning(f"Rate limit active until {time.ctime(rate_limit_until)}, skipping request")
         return {
@@ -82,84 +90,90 @@ async def get_hkgolden_topic_list(cat_id, sub_cat_id, start_page, max_pages, req
     elif api_key := HKGOLDEN_API.get("API_KEY"):
         headers["HKGAuth"] = api_key
 
-    items = []
+    merger = TopicMerger("id", stop_on_no_new=stop_on_no_new, watermark=watermark)
     rate_limit_info = []
     rate_limit_window = HKGOLDEN_API.get("RATE_LIMIT_WINDOW", 3600)
     rate_limit_requests = HKGOLDEN_API.get("RATE_LIMIT_REQUESTS", 100)
 
-    async with aiohttp.ClientSession() as session:
-        for page in range(start_page, start_page + max_pages):
-            api_key = get_api_topics_list_key(cat_id, page)
-            query_params = {
-                "thumb": "Y",
-                "sort": "0",
-                "sensormode": "Y",
-                "filtermodeS": "N",
-                "hideblock": "N",
-                "s": api_key,
-                "user_id": "0",
-                "returntype": "json"
-            }
-            endpoint = f"{base_url}/v1/topics/{cat_id}/{page}"
-            data, status = await fetch_with_retry(session, endpoint, headers, query_params)
-            logger.debug(f"Tried endpoint {endpoint}, status={status}, data={data}")
-
-            if data and data.get("result", True):
-                request_counter += 1
-                if request_counter >= rate_limit_requests:
-                    rate_limit_until = time.time() + rate_limit_window
-                    rate_limit_info.append(f"Rate limit reached: {request_counter} requests")
-
-                data_content = data.get("data", {})
-                if isinstance(data_content, dict) and "maxPage" in data_content:
-                    max_pages = min(max_pages, data_content["maxPage"], 10)
+    session = http_session("hkgolden")
+    for page in range(start_page, start_page + max_pages):
+        api_key = get_api_topics_list_key(cat_id, page)
+        query_params = {
+            "thumb": "Y",
+            "sort": "0",
+            "sensormode": "Y",
+            "filtermodeS": "N",
+            "hideblock": "N",
+            "s": api_key,
+            "user_id": "0",
+            "returntype": "json"
+        }
+        endpoint = f"{base_url}/v1/topics/{cat_id}/{page}"
+        data, status = await fetch_with_retry(session, endpoint, headers, query_params)
+        logger.debug(f"Tried endpoint {endpoint}, status={status}, data={data}")
 
-                new_items = data_content.get("list", [])
-                if not isinstance(new_items, (list, tuple)):
-                    error_msg = f"Unexpected data format for cat_id={cat_id}, page={page}, endpoint={endpoint}, data={data_content}"
-                    logger.error(error_msg)
-                    rate_limit_info.append(error_msg)
-                    continue
+        if data and data.get("result", True):
+            request_counter += 1
+            if request_counter >= rate_limit_requests:
+                rate_limit_until = time.time() + rate_limit_window
+                rate_limit_info.append(f"Rate limit reached: {request_counter} requests")
 
-                if not new_items:
-                    error_msg = f"Empty post list for cat_id={cat_id}, page={page}, endpoint={endpoint}, data={data_content}"
-                    logger.warning(error_msg)
-                    rate_limit_info.append(error_msg)
-                    continue
+            data_content = data.get("data", {})
+            if isinstance(data_content, dict) and "maxPage" in data_content:
+                max_pages = min(max_pages, data_content["maxPage"], 10)
 
-                for item in new_items:
-                    try:
-                        items.append({
-                            "id": item.get("thread_id", item.get("id", "")),
-                            "title": item.get("title", ""),
-                            "no_of_reply": int(item.get("no_of_reply", item.get("totalReplies", 0))),
-                            "create_time": int(item.get("create_time", item.get("messageDate", 0))) / 1000,
-                            "last_reply_time": int(item.get("orderDate", item.get("lastReplyDate", 0))) / 1000,
-                            "like_count": int(item.get("marksGood", 0)),
-                            "dislike_count": int(item.get("marksBad", 0))
-                        })
-                    except (ValueError, TypeError, AttributeError) as e:
-                        logger.warning(f"Invalid post data: {item}, error={str(e)}")
-                        continue
-            else:
-                error_msg = f"No posts found in response for cat_id={cat_id}, page={page}, endpoint={endpoint}, status={status}, data={data}"
-                if data and not data.get("result", True):
-                    error_msg += f", error_message={data.get('error_message', 'Unknown error')}"
+            new_items = data_content.get("list", [])
+            if not isinstance(new_items, (list, tuple)):
+                error_msg = f"Unexpected data format for cat_id={cat_id}, page={page}, endpoint={endpoint}, data={data_content}"
                 logger.error(error_msg)
                 rate_limit_info.append(error_msg)
+                continue
+
+            if not new_items:
+                error_msg = f"Empty post list for cat_id={cat_id}, page={page}, endpoint={endpoint}, data={data_content}"
+                logger.warning(error_msg)
+                rate_limit_info.append(error_msg)
+                continue
 
-            if len(items) >= 10:
+            page_items = []
+            for item in new_items:
+                try:
+                    page_items.append(TopicItem(
+                        thread_id=item.get("thread_id", item.get("id", "")),
+                        title=item.get("title", ""),
+                        no_of_reply=int(item.get("no_of_reply", item.get("totalReplies", 0))),
+                        create_time=int(item.get("create_time", item.get("messageDate", 0))) / 1000,
+                        last_reply_time=int(item.get("orderDate", item.get("lastReplyDate", 0))) / 1000,
+                        like_count=int(item.get("marksGood", 0)),
+                        dislike_count=int(item.get("marksBad", 0))
+                    ))
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.warning(f"Invalid post data: {item}, error={str(e)}")
+                    continue
+            new_count = merger.add_page(page_items)
+            if merger.should_stop(page_items, new_count):
+                logger.info(f"Stop paging cat_id={cat_id} at page={page}: reason={merger.stop_reason}, new_threads={new_count}")
                 break
+        else:
+            error_msg = f"No posts found in response for cat_id={cat_id}, page={page}, endpoint={endpoint}, status={status}, data={data}"
+            if data and not data.get("result", True):
+                error_msg += f", error_message={data.get('error_message', 'Unknown error')}"
+            logger.error(error_msg)
+            rate_limit_info.append(error_msg)
 
-            delay = HKGOLDEN_API.get("REQUEST_DELAY", 0.5)
-            await asyncio.sleep(delay)
+        if len(merger) >= 10:
+            break
 
-        if time.time() - last_reset > rate_limit_window:
-            request_counter = 0
-            last_reset = time.time()
+    if time.time() - last_reset > rate_limit_window:
+        request_counter = 0
+        last_reset = time.time()
 
+    items = merger.items
+    if merger.duplicates:
+        logger.info(f"Merged duplicate threads across pages: cat_id={cat_id}, duplicates={merger.duplicates}, unique={len(items)}")
     return {
         "items": items,
+        "merge_info": merger.summary(),
         "rate_limit_info": rate_limit_info,
         "request_counter": request_counter,
         "last_reset": last_reset,
@@ -198,74 +212,85 @@ async def get_hkgolden_thread_content(thread_id, cat_id, request_counter, last_r
     rate_limit_info = []
     rate_limit_window = HKGOLDEN_API.get("RATE_LIMIT_WINDOW", 3600)
     rate_limit_requests = HKGOLDEN_API.get("RATE_LIMIT_REQUESTS", 100)
-    replies = []
+    # 「全部回覆」時 max_replies 等於帖子回覆總數，超出記憶體上限的回覆寫入臨時檔案
+    replies = ReplySpool()
     title = ""
     total_replies = 0
+    thread_status = None
 
-    async with aiohttp.ClientSession() as session:
-        page = 1
-        while True:
-            api_key = get_api_topic_details_key(thread_id, page)
-            query_params = {
-                "s": api_key,
-                "message": str(thread_id),
-                "page": str(page),
-                "user_id": "0",
-                "sensormode": "Y",
-                "hideblock": "N",
-                "returntype": "json"
-            }
-            endpoint = f"{base_url}/v1/view/{thread_id}/{page}"
+    session = http_session("hkgolden")
+    page = 1
+    while True:
+        api_key = get_api_topic_details_key(thread_id, page)
+        query_params = {
+            "s": api_key,
+            "message": str(thread_id),
+            "page": str(page),
+            "user_id": "0",
+            "sensormode": "Y",
+            "hideblock": "N",
+            "returntype": "json"
+        }
+        endpoint = f"{base_url}/v1/view/{thread_id}/{page}"
+        try:
             data, status = await fetch_with_retry(session, endpoint, headers, query_params)
-            logger.debug(f"Tried thread endpoint {endpoint}, status={status}, data={data}")
+        except BaseException:
+            # 熔斷、搶佔或取消時關閉 ReplySpool，避免遺留臨時檔案
+            replies.close()
+            raise
+        logger.debug(f"Tried thread endpoint {endpoint}, status={status}, data={data}")
 
-            if data and data.get("result", True):
-                request_counter += 1
-                if request_counter >= rate_limit_requests:
-                    rate_limit_until = time.time() + rate_limit_window
-                    rate_limit_info.append(f"Rate limit reached: {request_counter} requests")
+        if data and data.get("result", True):
+            request_counter += 1
+            if request_counter >= rate_limit_requests:
+                rate_limit_until = time.time() + rate_limit_window
+                rate_limit_info.append(f"Rate limit reached: {request_counter} requests")
 
-                thread_data = data.get("data", {})
-                if page == 1:
-                    title = thread_data.get("title", "")
-                    total_replies = int(thread_data.get("totalReplies", thread_data.get("no_of_reply", 0)))
+            thread_data = data.get("data", {})
+            if page == 1:
+                title = thread_data.get("title", "")
+                total_replies = int(thread_data.get("totalReplies", thread_data.get("no_of_reply", 0)))
 
-                new_replies = thread_data.get("replies", [])
-                if not new_replies and page > 1:
-                    break
+            new_replies = thread_data.get("replies", [])
+            if not new_replies and page > 1:
+                break
 
-                for reply in new_replies:
-                    msg = reply.get("content", reply.get("msg", ""))
-                    if msg.strip():
-                        replies.append({
-                            "msg": msg,
-                            "reply_time": int(reply.get("time", 0)) / 1000,
-                            "like_count": reply.get("like_count", 0),
-                            "dislike_count": reply.get("dislike_count", 0)
-                        })
+            for reply in new_replies:
+                # 高登回應沒有被引用回覆的 ID，只移除引用內容
+                msg, _ = strip_quotes(reply.get("content", reply.get("msg", "")))
+                if msg.strip():
+                    replies.append(Reply(
+                        msg=msg,
+                        reply_time=int(reply.get("time", 0)) / 1000,
+                        like_count=reply.get("like_count", 0),
+                        dislike_count=reply.get("dislike_count", 0)
+                    ))
 
-                if len(replies) >= max_replies:
-                    break
-                page += 1
-            else:
-                error_msg = f"Thread fetch failed for thread_id={thread_id}, endpoint={endpoint}, status={status}, data={data}"
-                if data and not data.get("result", True):
-                    error_msg += f", error_message={data.get('error_message', 'Unknown error')}"
-                logger.error(error_msg)
-                rate_limit_info.append(error_msg)
+            if len(replies) >= max_replies:
                 break
+            page += 1
+        else:
+            error_msg = f"Thread fetch failed for thread_id={thread_id}, endpoint={endpoint}, status={status}, data={data}"
+            if data and not data.get("result", True):
+                error_msg += f", error_message={data.get('error_message', 'Unknown error')}"
+                # 第一頁就返回失敗，帖子已被刪除或無效
+                thread_status = "invalid" if page == 1 else "error"
+            else:
+                thread_status = "invalid" if status == 404 else "rate_limited" if status == 429 else "error"
+            logger.error(error_msg)
+            rate_limit_info.append(error_msg)
+            break
 
-            delay = HKGOLDEN_API.get("REQUEST_DELAY", 0.5)
-            await asyncio.sleep(delay)
-
-        if time.time() - last_reset > rate_limit_window:
-            request_counter = 0
-            last_reset = time.time()
+    if time.time() - last_reset > rate_limit_window:
+        request_counter = 0
+        last_reset = time.time()
 
+    replies.truncate(max_replies)
     return {
-        "replies": replies[:max_replies],
+        "replies": replies,
         "title": title,
         "total_replies": total_replies,
+        "thread_status": thread_status if not replies else None,
         "rate_limit_info": rate_limit_info,
         "request_counter": request_counter,
         "last_reset": last_reset,
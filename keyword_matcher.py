@@ -0,0 +1,123 @@
+import re
+from collections import Counter, deque
+from functools import lru_cache
+import numpy as np
+from config import FILTER_KEYWORDS
+
+# 篩選條件中「包含」之後以引號標示的關鍵字，例如：標題包含「政治」或‘選舉’
+_CONTAINS_CLAUSE = re.compile(r"包含([^，；。;]*)")
+_QUOTED = re.compile(r"[「『‘“\"']([^」』’”\"']+)[」』’”\"']")
+
+class KeywordMatcher:
+    """Aho-Corasick 多關鍵字匹配器：建構一次，之後每段文字只需掃描一遍即可找出所有關鍵字
+
+    關鍵字及文字均轉為小寫比較。轉移表預先補全失敗鏈接，掃描時每個字元只需查表一次；
+    不屬於任何關鍵字的字元直接回到根節點。批量判斷另把轉移表展開為 NumPy 二維陣列，
+    所有文字按字元位置同步前進，每個位置只需一次向量化查表。
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(keyword.lower() for keyword in keywords if keyword))
+        self._goto = [{}]
+        self._outputs = [()]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._outputs.append(())
+                state = next_state
+            self._outputs[state] = (keyword,)
+        self._build_transitions()
+        self._build_table()
+
+    def _build_transitions(self):
+        # 按廣度優先計算失敗鏈接；較淺的狀態先補全，較深的狀態再繼承其失敗狀態的轉移及輸出
+        fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            self._outputs[state] = self._outputs[state] + self._outputs[fail[state]]
+            for char, next_state in self._goto[state].items():
+                fail[next_state] = self._goto[fail[state]].get(char, 0)
+                queue.append(next_state)
+            for char, next_state in self._goto[fail[state]].items():
+                self._goto[state].setdefault(char, next_state)
+
+    def _build_table(self):
+        # 字元按碼位排序編號，0 號代表不屬於任何關鍵字的字元（包括補齊長度的 \0），轉移到根節點
+        alphabet = sorted({char for keyword in self.keywords for char in keyword})
+        self._codepoints = np.array([ord(char) for char in alphabet], dtype=np.uint32)
+        self._table = np.zeros((len(self._goto), len(alphabet) + 1), dtype=np.int32)
+        for state, transitions in enumerate(self._goto):
+            for symbol, char in enumerate(alphabet, 1):
+                self._table[state, symbol] = transitions.get(char, 0)
+        self._accepting = np.array([bool(outputs) for outputs in self._outputs])
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def finditer(self, text: str):
+        """逐個返回 (起始位置, 關鍵字)，包括重疊的匹配"""
+        goto, outputs = self._goto, self._outputs
+        state = 0
+        for index, char in enumerate(text.lower()):
+            state = goto[state].get(char, 0)
+            for keyword in outputs[state]:
+                yield index - len(keyword) + 1, keyword
+
+    def contains_any(self, text: str) -> bool:
+        goto, outputs = self._goto, self._outputs
+        state = 0
+        for char in text.lower():
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                return True
+        return False
+
+    def contains_any_batch(self, texts) -> np.ndarray:
+        """批量判斷：文字補齊為等長的碼位矩陣，所有文字按字元位置同步走自動機"""
+        texts = list(texts)
+        if not self.keywords or not texts:
+            return np.zeros(len(texts), dtype=bool)
+        chars = np.char.lower(np.array(texts, dtype=str))
+        codepoints = chars.view(np.uint32).reshape(len(texts), -1)
+        # 碼位轉為字元編號：不在字母表中的字元為 0
+        symbols = np.searchsorted(self._codepoints, codepoints)
+        found = symbols < len(self._codepoints)
+        found[found] = self._codepoints[symbols[found]] == codepoints[found]
+        symbols = np.where(found, symbols + 1, 0)
+        state = np.zeros(len(texts), dtype=np.int32)
+        mask = np.zeros(len(texts), dtype=bool)
+        for column in symbols.T:
+            state = self._table[state, column]
+            mask |= self._accepting[state]
+        return mask
+
+    def counts(self, text: str) -> Counter:
+        return Counter(keyword for _, keyword in self.finditer(text))
+
+@lru_cache(maxsize=64)
+def _compile(keywords: tuple) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+def compile_keywords(keywords) -> KeywordMatcher:
+    """按關鍵字集合緩存編譯結果，相同集合只建構一次自動機"""
+    return _compile(tuple(sorted(set(keyword.lower() for keyword in keywords if keyword))))
+
+def keywords_for_condition(filter_condition: str) -> list:
+    """從篩選條件中取出關鍵字：提及 FILTER_KEYWORDS 的關鍵字組名稱時加入整組，另加入「包含」後引號內的詞語"""
+    condition = filter_condition.lower()
+    keywords = []
+    for name, group in FILTER_KEYWORDS.items():
+        if name in condition:
+            keywords.extend(group)
+    for clause in _CONTAINS_CLAUSE.findall(condition):
+        keywords.extend(term.strip() for term in _QUOTED.findall(clause) if term.strip())
+    return keywords
+
+def matcher_for_condition(filter_condition: str) -> KeywordMatcher:
+    return compile_keywords(keywords_for_condition(filter_condition))
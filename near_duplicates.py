@@ -0,0 +1,64 @@
+import re
+import numpy as np
+from config import REPLY_DEDUP
+
+# 計算指紋前移除空白、標點及符號，只比較文字內容
+_NOISE = re.compile(r"[\s\W_]+")
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+_MASK64 = (1 << 64) - 1
+
+def simhash(text: str, shingle: int = REPLY_DEDUP["SHINGLE"]) -> int:
+    """以字元 n-gram 計算 64 位 SimHash：內容相近的文字指紋只有少數位元不同
+
+    n-gram 使用內建 hash()，同一進程內穩定；指紋只在單次處理中比較，不會持久化。
+    """
+    normalized = _NOISE.sub("", text.lower())
+    if len(normalized) <= shingle:
+        grams = [normalized]
+    else:
+        grams = [normalized[i:i + shingle] for i in range(len(normalized) - shingle + 1)]
+    hashes = np.fromiter((hash(gram) & _MASK64 for gram in grams), dtype=np.uint64, count=len(grams))
+    # 每個位元按 n-gram 投票，多數為 1 的位元在指紋中設為 1
+    bits = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).sum(axis=0)
+    votes = bits * 2 > len(grams)
+    return int(np.packbits(votes[::-1]).view(">u8")[0])
+
+class NearDuplicateIndex:
+    """單一帖子的串流近似重複索引
+
+    指紋按 bands 段切分並以每段的值建立索引：漢明距離不超過 max_distance（小於段數）的兩個指紋，
+    必定至少有一段完全相同，因此只需比較同段的候選。
+    """
+
+    def __init__(self, max_distance: int = REPLY_DEDUP["MAX_DISTANCE"], bands: int = REPLY_DEDUP["BANDS"]):
+        self.max_distance = max_distance
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self._buckets = [{} for _ in range(bands)]
+        self.fingerprints = []
+        self.counts = []
+        self.duplicates = 0
+
+    def _band_values(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        return [(fingerprint >> (band * self.band_bits)) & mask for band in range(self.bands)]
+
+    def add(self, text: str):
+        """加入一條回覆，返回 (代表條目的編號, 是否新條目)；近似重複的回覆計入已有條目"""
+        fingerprint = simhash(text)
+        band_values = self._band_values(fingerprint)
+        for band, value in enumerate(band_values):
+            for entry in self._buckets[band].get(value, ()):
+                if bin(fingerprint ^ self.fingerprints[entry]).count("1") <= self.max_distance:
+                    self.counts[entry] += 1
+                    self.duplicates += 1
+                    return entry, False
+        entry = len(self.fingerprints)
+        self.fingerprints.append(fingerprint)
+        self.counts.append(1)
+        for band, value in enumerate(band_values):
+            self._buckets[band].setdefault(value, []).append(entry)
+        return entry, True
+
+    def __len__(self):
+        return len(self.fingerprints)
@@ -0,0 +1,103 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import streamlit.logger
+from config import NEGATIVE_CACHE
+
+logger = streamlit.logger.get_logger(__name__)
+
+# 負面結果類型
+INVALID = "invalid"  # 帖子已刪除、無效或無權訪問
+ERROR = "error"  # 請求失敗（非 200、無效 JSON 等）
+EMPTY = "empty"  # 請求成功但沒有任何回覆
+RATE_LIMITED = "rate_limited"  # 重試耗盡仍被限流；冷卻由 pacer 處理，不記錄
+
+class BloomFilter:
+    """固定大小的位陣列，只支援加入和查詢；可能誤判存在，但不會漏判"""
+
+    def __init__(self, bits: int, hashes: int):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class NegativeCache:
+    """記錄無效、已刪除或空的帖子，短期內不再為它們發出請求"""
+
+    def __init__(self, config: dict = NEGATIVE_CACHE):
+        self.ttls = {INVALID: config["INVALID_TTL"], ERROR: config["ERROR_TTL"], EMPTY: config["EMPTY_TTL"]}
+        self.max_entries = config["MAX_ENTRIES"]
+        self.bloom_bits = config["BLOOM_BITS"]
+        self.bloom_hashes = config["BLOOM_HASHES"]
+        self.dead_rotate = config["DEAD_ROTATE"]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 兩代布隆過濾器輪替：「已知失效」的帖子最長保留兩個輪替週期，誤判也會隨之過期
+        self._dead = BloomFilter(self.bloom_bits, self.bloom_hashes)
+        self._previous_dead = None
+        self._rotated = time.time()
+        self.stats = {"recorded": 0, "hits": 0, "bloom_hits": 0, "rotations": 0}
+
+    @staticmethod
+    def _key(platform: str, thread_id) -> str:
+        return f"{platform}:{thread_id}"
+
+    def _rotate(self, now: float):
+        if now - self._rotated >= self.dead_rotate:
+            self._previous_dead = self._dead
+            self._dead = BloomFilter(self.bloom_bits, self.bloom_hashes)
+            self._rotated = now
+            self.stats["rotations"] += 1
+
+    def record(self, platform: str, thread_id, reason: str):
+        key = self._key(platform, thread_id)
+        now = time.time()
+        with self._lock:
+            self._rotate(now)
+            self._entries[key] = (now + self.ttls[reason], reason)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if reason == INVALID:
+                self._dead.add(key)
+            self.stats["recorded"] += 1
+        logger.info(f"Negative cache recorded: platform={platform}, thread_id={thread_id}, reason={reason}, ttl={self.ttls[reason]}s")
+
+    def check(self, platform: str, thread_id) -> str:
+        """返回帖子的負面結果類型；沒有記錄時返回 None"""
+        key = self._key(platform, thread_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.stats["hits"] += 1
+                    return entry[1]
+                del self._entries[key]
+            self._rotate(now)
+            if key in self._dead or (self._previous_dead is not None and key in self._previous_dead):
+                self.stats["bloom_hits"] += 1
+                return INVALID
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), known_dead=self._dead.count)
+
+negative_cache = NegativeCache()
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import streamlit.logger
+from config import PACING
+
+logger = streamlit.logger.get_logger(__name__)
+
+class AdaptivePacer:
+    """單一主機的 AIMD 請求節奏：回應健康時加性提速，429 或回應過慢時乘性降速"""
+
+    def __init__(self, host: str, rate: float = None, config: dict = PACING):
+        self.host = host
+        self.min_rate = config["MIN_RATE"]
+        self.max_rate = config["MAX_RATE"]
+        self.increase = config["ADDITIVE_INCREASE"]
+        self.decrease = config["MULTIPLICATIVE_DECREASE"]
+        self.slow_response = config["SLOW_RESPONSE"]
+        self.max_backoff = config["MAX_BACKOFF"]
+        self.metrics_window = config["METRICS_WINDOW"]
+        self.rate = min(self.max_rate, max(self.min_rate, rate or config["INITIAL_RATE"]))
+        self.next_slot = 0.0
+        self.blocked_until = 0.0
+        self.completed = deque()
+        self.stats = {"requests": 0, "increases": 0, "decreases": 0, "throttled": 0, "slow": 0, "waited": 0.0}
+
+    async def wait(self):
+        """按當前速率預約下一個發送時間並等待；多個協程並發調用時依次排開"""
+        now = time.time()
+        slot = max(now, self.next_slot, self.blocked_until)
+        self.next_slot = slot + 1 / self.rate
+        delay = slot - now
+        if delay > 0:
+            self.stats["waited"] += delay
+            await asyncio.sleep(delay)
+
+    def record(self, status: int, latency: float, retry_after: float = None) -> float:
+        """根據回應調整速率；返回伺服器要求的等待秒數（無則為 0）"""
+        now = time.time()
+        self.stats["requests"] += 1
+        self.completed.append(now)
+        backoff = 0.0
+        if status == 429:
+            self.stats["throttled"] += 1
+            self._decrease()
+            # Retry-After 是伺服器給出的確切冷卻時間，所有排隊請求都要等到它過去
+            backoff = min(retry_after if retry_after is not None else 1 / self.rate, self.max_backoff)
+            self.blocked_until = max(self.blocked_until, now + backoff)
+        elif status >= 500 or latency >= self.slow_response:
+            self.stats["slow"] += 1
+            self._decrease()
+        elif status < 400:
+            previous = self.rate
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            if self.rate > previous:
+                self.stats["increases"] += 1
+        pacer_registry.mark_dirty()
+        return backoff
+
+    def _decrease(self):
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.stats["decreases"] += 1
+
+    def effective_rate(self) -> float:
+        """最近統計窗口內實際完成的每秒請求數"""
+        now = time.time()
+        while self.completed and now - self.completed[0] > self.metrics_window:
+            self.completed.popleft()
+        return len(self.completed) / self.metrics_window
+
+    def snapshot(self) -> dict:
+        return dict(
+            self.stats,
+            rate=round(self.rate, 3),
+            effective_rate=round(self.effective_rate(), 3),
+            blocked_for=max(0.0, round(self.blocked_until - time.time(), 2))
+        )
+
+def parse_retry_after(value) -> float:
+    """解析 Retry-After 標頭（秒數或 HTTP 日期）；無法解析時返回 None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.replace(".", "", 1).isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class PacerRegistry:
+    """按主機管理 AdaptivePacer，並把學到的速率保存到檔案供重啟後沿用"""
+
+    def __init__(self, state_file: str, save_interval: float):
+        self.state_file = state_file
+        self.save_interval = save_interval
+        self._pacers = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.time()
+        self._learned = self._load()
+
+    def _load(self) -> dict:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            logger.info(f"Loaded learned request rates: {state}")
+            return {host: entry["rate"] for host, entry in state.items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"無法讀取已學習的請求速率: file={self.state_file}, error={str(e)}")
+            return {}
+
+    def get(self, url: str) -> AdaptivePacer:
+        host = urlparse(url).netloc or url
+        with self._lock:
+            pacer = self._pacers.get(host)
+            if pacer is None:
+                pacer = AdaptivePacer(host, rate=self._learned.get(host))
+                self._pacers[host] = pacer
+            return pacer
+
+    def mark_dirty(self):
+        self._dirty = True
+        if time.time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        if not self.state_file or not self._dirty:
+            return
+        with self._lock:
+            state = {host: {"rate": pacer.rate, "updated": time.time()} for host, pacer in self._pacers.items()}
+        tmp_file = f"{self.state_file}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_file, self.state_file)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"無法保存請求速率: file={self.state_file}, error={str(e)}")
+        self._last_save = time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pacers = list(self._pacers.values())
+        return {pacer.host: pacer.snapshot() for pacer in pacers}
+
+pacer_registry = PacerRegistry(PACING["STATE_FILE"], PACING["SAVE_INTERVAL"])
+
+def get_pacer(url: str) -> AdaptivePacer:
+    return pacer_registry.get(url)
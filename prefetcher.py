@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+import traceback
+import streamlit.logger
+from config import LIHKG_API, HKGOLDEN_API, PREFETCH
+from data_processor import fetch_topic_list, fetch_thread_content
+from session_cache import get_fresh, shared_thread_cache
+from reply_spool import ReplySpool
+from negative_cache import negative_cache
+from topic_store import TopicColumns
+from ranking import rank
+from async_runtime import get_runtime
+from fetch_scheduler import fetch_priority, FetchPreempted, PREFETCH_PRIORITY
+
+logger = streamlit.logger.get_logger(__name__)
+
+class CategoryPrefetcher:
+    """定期刷新所有分類的帖子列表，並預先抓取最活躍帖子的內容到共享緩存"""
+
+    def __init__(self, config: dict = PREFETCH):
+        self.interval = config["INTERVAL"]
+        self.topic_pages = config["TOPIC_PAGES"]
+        self.top_k = config["TOP_K"]
+        self.max_replies = config["MAX_REPLIES"]
+        self.max_age = config["MAX_AGE"]
+        self.counters = {
+            platform: {"request_counter": 0, "last_reset": time.time(), "rate_limit_until": 0}
+            for platform in ("LIHKG", "高登討論區")
+        }
+        self.stats = {"cycles": 0, "topic_lists": 0, "threads": 0, "preempted": 0, "errors": 0, "last_cycle_seconds": None}
+        self._future = None
+        self._lock = threading.Lock()
+
+    def categories(self):
+        for cat_name, cat_id in LIHKG_API["CATEGORIES"].items():
+            yield "LIHKG", cat_name, cat_id
+        for cat_name, cat_id in HKGOLDEN_API["CATEGORIES"].items():
+            yield "高登討論區", cat_name, cat_id
+
+    def _update_counters(self, platform, result):
+        counters = self.counters[platform]
+        counters["request_counter"] = result["request_counter"]
+        counters["last_reset"] = result["last_reset"]
+        counters["rate_limit_until"] = result["rate_limit_until"]
+
+    async def _refresh_category(self, platform, cat_name, cat_id):
+        result = await fetch_topic_list(platform, cat_id, self.topic_pages, self.counters[platform], refresh=True)
+        self._update_counters(platform, result)
+        if result.get("stale"):
+            # 熔斷中，等下一輪再刷新
+            logger.info(f"Prefetch skipped, circuit open: platform={platform}, category={cat_name}")
+            return
+        items = result["items"]
+        if not items:
+            logger.warning(f"Prefetch got empty topic list: platform={platform}, category={cat_name}")
+            return
+        self.stats["topic_lists"] += 1
+
+        # 按熱度（近期回覆速度 × 點讚比例）預取，最可能被問到的帖子優先進入緩存
+        store = TopicColumns(items, id_key="thread_id" if platform == "LIHKG" else "id", platform=platform)
+        mask = store.exclude(store.has_replies(), lambda thread_id: negative_cache.check(platform, thread_id) is not None)
+        active_items = store.take(rank(store, mask, self.top_k, by="hotness"))
+        for item in active_items:
+            thread_id = item.get("thread_id", item.get("id"))
+            no_of_reply = item.get("no_of_reply", 0)
+            cached = get_fresh(shared_thread_cache, (platform, thread_id), self.max_age)
+            if cached is not None and (cached["data"]["total_replies"] or 0) >= no_of_reply:
+                continue
+            thread_result = await fetch_thread_content(
+                platform, thread_id, cat_id, min(no_of_reply, self.max_replies), self.counters[platform], refresh=True
+            )
+            self._update_counters(platform, thread_result)
+            # 共享緩存保存的是獨立的列表或壓縮數據，抓取返回的 ReplySpool 可立即關閉
+            if isinstance(thread_result["replies"], ReplySpool):
+                thread_result["replies"].close()
+            self.stats["threads"] += 1
+
+    async def refresh_once(self):
+        start = time.time()
+        for platform, cat_name, cat_id in self.categories():
+            try:
+                # 預取請求只使用排程器分配給預取的預算，且會被互動請求搶佔
+                with fetch_priority(PREFETCH_PRIORITY):
+                    await self._refresh_category(platform, cat_name, cat_id)
+            except FetchPreempted:
+                self.stats["preempted"] += 1
+                logger.info(f"Prefetch preempted by interactive requests: platform={platform}, category={cat_name}")
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Prefetch failed: platform={platform}, category={cat_name}, error={str(e)}, traceback={traceback.format_exc()}")
+        self.stats["cycles"] += 1
+        self.stats["last_cycle_seconds"] = time.time() - start
+        logger.info(f"Prefetch cycle completed: elapsed={self.stats['last_cycle_seconds']:.2f}s, stats={self.stats}")
+
+    async def run_forever(self):
+        while True:
+            start = time.time()
+            await self.refresh_once()
+            await asyncio.sleep(max(0, self.interval - (time.time() - start)))
+
+    def start(self):
+        """在常駐事件循環中啟動預取任務，重複調用不會重複啟動"""
+        with self._lock:
+            if self._future is None or self._future.done():
+                self._future = get_runtime().spawn(self.run_forever())
+                logger.info(f"Prefetcher started: interval={self.interval}s, top_k={self.top_k}, pages={self.topic_pages}")
+
+prefetcher = CategoryPrefetcher()
+
+def start_prefetcher():
+    if PREFETCH["ENABLED"]:
+        prefetcher.start()
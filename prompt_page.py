@@ -1,8 +1,9 @@
 import streamlit as st
-import asyncio
 from datetime import datetime
 import pytz
 from data_processor import process_user_question
+from session_cache import init_session_cache
+from async_runtime import get_runtime, ScriptAbandoned
 import time
 from config import LIHKG_API, HKGOLDEN_API, GENERAL
 import streamlit.logger
@@ -10,20 +11,19 @@ import streamlit.logger
 logger = streamlit.logger.get_logger(__name__)
 HONG_KONG_TZ = pytz.timezone(GENERAL["TIMEZONE"])
 
-async def prompt_page():
+def prompt_page():
+    runtime = get_runtime()
     st.title("Grok3看到的prompt")
     
     # 初始化 session_state
-    if "prompt_history" not in st.session_state:
-        st.session_state.prompt_history = []
+    init_session_cache("prompt_history", history=True)
     if "rate_limit_until" not in st.session_state:
         st.session_state.rate_limit_until = 0
     if "request_counter" not in st.session_state:
         st.session_state.request_counter = 0
     if "last_reset" not in st.session_state:
         st.session_state.last_reset = time.time()
-    if "thread_content_cache" not in st.session_state:
-        st.session_state.thread_content_cache = {}
+    init_session_cache("thread_content_cache")
     if "last_submit_key" not in st.session_state:
         st.session_state.last_submit_key = None
     if "last_submit_time" not in st.session_state:
@@ -98,17 +98,20 @@ async def prompt_page():
             else:
                 try:
                     logger.info(f"Calling process_user_question: question={user_input}, platform={platform}, category={selected_cat}")
-                    result = await process_user_question(
+                    result = runtime.run(process_user_question(
                         user_input,
                         platform=platform,
                         cat_id_map=categories,
                         selected_cat=selected_cat,
                         return_prompt=True
-                    )
+                    ))
                     st.session_state.thread_content_cache[cache_key] = {
                         "data": result,
                         "timestamp": time.time()
                     }
+                except ScriptAbandoned:
+                    st.session_state.input_processed = False
+                    return
                 except Exception as e:
                     result = {}
                     debug_info = [f"#### 調試信息：\n- 處理錯誤: 原因={str(e)}"]
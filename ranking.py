@@ -0,0 +1,91 @@
+import time
+import numpy as np
+from config import RANKING
+from thread_metrics import thread_metrics
+
+# 評分函數註冊表：名稱 -> (說明, 函數)；函數接收 TopicColumns 及當前時間，返回按優先次序排列的分數陣列（全部降序比較）
+SCORERS = {}
+
+# 篩選條件中的排序描述 -> 評分函數名稱；條件中出現多個時以最先出現者為準
+CONDITION_KEYWORDS = {
+    "按熱度排序": "hotness",
+    "按回覆速度排序": "hotness",
+    "按點讚比例排序": "like_ratio",
+    "按回覆數量排序": "replies",
+    "按回覆數排序": "replies",
+    "按最後回覆時間排序": "recency"
+}
+
+def scorer(name: str, label: str):
+    """註冊評分函數；label 用於提示詞中描述排序方式"""
+    def register(func):
+        SCORERS[name] = (label, func)
+        return func
+    return register
+
+@scorer("recency", "最後回覆時間")
+def recency(store, now):
+    return [store.last_reply_time]
+
+@scorer("replies", "回覆數量")
+def replies(store, now):
+    return [store.no_of_reply, store.last_reply_time]
+
+def like_ratio_scores(store) -> np.ndarray:
+    """點讚比例，加一平滑：沒有評價的帖子為 0.5"""
+    return (store.like_count + 1) / (store.like_count + store.dislike_count + 2)
+
+def reply_velocity(store, now) -> np.ndarray:
+    """每小時平均回覆數：回覆數量除以帖子年齡"""
+    age = np.where(store.create_time > 0, now - store.create_time, RANKING["HOTNESS_UNKNOWN_AGE"])
+    age = np.maximum(age, RANKING["HOTNESS_MIN_AGE"])
+    return store.no_of_reply / (age / 3600)
+
+@scorer("like_ratio", "點讚比例")
+def like_ratio(store, now):
+    return [like_ratio_scores(store), store.no_of_reply]
+
+def recent_velocity(store, now) -> np.ndarray:
+    """近期回覆速度：優先使用時間序列快照的平滑速度，快照不足時以帖子整體的平均速度代替"""
+    lifetime = reply_velocity(store, now)
+    if store.platform is None:
+        return lifetime
+    recent = thread_metrics.velocities(store.platform, store.thread_ids)
+    return np.where(np.isnan(recent), lifetime, recent)
+
+@scorer("hotness", "熱度（近期回覆速度 × 點讚比例）")
+def hotness(store, now):
+    return [recent_velocity(store, now) * like_ratio_scores(store), store.last_reply_time]
+
+def scorer_for_condition(filter_condition: str) -> str:
+    """從篩選條件文字中找出排序方式，沒有指定時返回預設評分函數"""
+    found = [(filter_condition.find(keyword), name) for keyword, name in CONDITION_KEYWORDS.items() if keyword in filter_condition]
+    return min(found)[1] if found else RANKING["DEFAULT"]
+
+def scorer_label(name: str) -> str:
+    return SCORERS[name][0]
+
+def top_k_indices(mask: np.ndarray, k: int, columns) -> np.ndarray:
+    """返回遮罩內按 columns（依次比較，全部降序）排名前 k 的索引
+
+    先以 argpartition 按第一個分數找出第 k 大的值，只對不小於它的候選（包括並列）做完整排序，
+    排序成本隨 k 而非帖子總數增長。
+    """
+    candidates = np.flatnonzero(mask)
+    if k <= 0 or not len(candidates):
+        return candidates[:0]
+    columns = [column[candidates] for column in columns]
+    if k < len(candidates):
+        primary = columns[0]
+        threshold = primary[np.argpartition(-primary, k - 1)[k - 1]]
+        keep = primary >= threshold
+        candidates = candidates[keep]
+        columns = [column[keep] for column in columns]
+    # np.lexsort 以最後一個鍵為主鍵，取負數得到降序
+    order = np.lexsort([-column for column in reversed(columns)])
+    return candidates[order[:k]]
+
+def rank(store, mask: np.ndarray, k: int, by: str = None, now: float = None) -> np.ndarray:
+    """以評分函數 by 對遮罩內的帖子評分，返回排名前 k 的索引"""
+    _, func = SCORERS[by or RANKING["DEFAULT"]]
+    return top_k_indices(mask, k, func(store, time.time() if now is None else now))
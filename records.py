@@ -0,0 +1,62 @@
+class Record:
+    """以 __slots__ 存放欄位的輕量記錄，每筆不需要各自保存一份鍵名字典
+
+    提供 dict 風格的讀取介面（get、[]、in），現有以鍵名讀取帖子及回覆的代碼無需改動。
+    """
+
+    __slots__ = ()
+    DEFAULTS = {}
+    # 其他鍵名 -> 欄位名，例如高登帖子列表以 "id" 表示帖子 ID
+    ALIASES = {}
+
+    def __init__(self, **fields):
+        unknown = fields.keys() - set(self.__slots__)
+        if unknown:
+            raise TypeError(f"{type(self).__name__} got unexpected fields: {sorted(unknown)}")
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name, self.DEFAULTS.get(name)))
+
+    def get(self, key, default=None):
+        value = getattr(self, self.ALIASES.get(key, key), None)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self.ALIASES.get(key, key))
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key) -> bool:
+        return self.ALIASES.get(key, key) in self.__slots__
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if getattr(self, name) is not None)
+        return f"{type(self).__name__}({fields})"
+
+class TopicItem(Record):
+    """帖子列表中的一個帖子"""
+
+    __slots__ = ("thread_id", "title", "no_of_reply", "last_reply_time", "create_time", "like_count", "dislike_count", "cat_id", "search_hits")
+    DEFAULTS = {"title": "", "no_of_reply": 0, "last_reply_time": 0, "create_time": 0, "like_count": 0, "dislike_count": 0}
+    ALIASES = {"id": "thread_id"}
+
+class Reply(Record):
+    """帖子的一條回覆（msg 為已移除引用的 HTML）"""
+
+    __slots__ = ("msg", "post_id", "msg_num", "quote_post_id", "reply_time", "like_count", "dislike_count")
+    DEFAULTS = {"msg": "", "like_count": 0, "dislike_count": 0}
+
+class ReplyExcerpt(Record):
+    """選入提示詞的回覆：清理後的內容、樓層號、引用的樓層及近似重複的數量"""
+
+    __slots__ = ("content", "ref", "quote", "count")
+    DEFAULTS = {"count": 1}
+
+class ThreadData(Record):
+    """已選帖子的元數據及選入提示詞的回覆，同一份同時用於會話緩存及提示詞"""
+
+    __slots__ = ("thread_id", "title", "no_of_reply", "last_reply_time", "like_count", "dislike_count", "total_replies", "replies", "rate_limit_info", "timestamp")
+    DEFAULTS = {"no_of_reply": 0, "last_reply_time": 0, "like_count": 0, "dislike_count": 0, "total_replies": 0}
@@ -0,0 +1,87 @@
+import math
+import re
+from collections import Counter
+import numpy as np
+from config import RELEVANCE
+
+# 中日韓文字連續片段按字元二元組切分，英文及數字按單詞切分
+_TOKEN = re.compile(r"[a-z0-9]+|[\u3400-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+")
+_CJK = re.compile(r"[^a-z0-9]")
+
+# 用戶問題中描述操作而非內容的詞，不參與相關性評分
+QUERY_STOPWORDS = {"分享", "帖子", "一個", "幾個", "討論", "論區", "最新", "有咩", "有冇", "請問", "幫我", "排列", "今日", "回覆", "內容"}
+
+def tokenize(text: str, tail: bool = False) -> list:
+    """tail 為 True 時每段中日韓文字額外加入最後一個字，使每個字都是某個詞的開頭，單字可用前綴匹配"""
+    tokens = []
+    for run in _TOKEN.findall(text.lower()):
+        if len(run) > 1 and _CJK.match(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            if tail:
+                tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return tokens
+
+def token_runs(text: str) -> list:
+    """按 tokenize 的規則切出連續的中日韓文字片段及英文數字單詞"""
+    return _TOKEN.findall(text.lower())
+
+def query_tokens(question: str, keywords=()) -> list:
+    """把用戶問題及篩選關鍵字轉為查詢詞，去除重複及操作性詞語"""
+    tokens = tokenize(question)
+    for keyword in keywords:
+        tokens.extend(tokenize(keyword))
+    return [token for token in dict.fromkeys(tokens) if token not in QUERY_STOPWORDS]
+
+class BM25Index:
+    """單一帖子回覆的 BM25 索引：逐條加入回覆時即時更新詞頻、文件頻率及平均長度，查詢時才計算 IDF
+
+    預先知道查詢詞時傳入 vocabulary，只為這些詞記錄倒排列表，每條回覆只佔一個長度值，
+    回覆數量很大的帖子也不會因索引而佔用大量記憶體。
+    """
+
+    def __init__(self, k1: float = RELEVANCE["K1"], b: float = RELEVANCE["B"], vocabulary=None):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = set(vocabulary) if vocabulary is not None else None
+        self._postings = {}
+        self._lengths = []
+        self._total_length = 0
+
+    def add(self, text: str) -> int:
+        """加入一條回覆，返回其編號"""
+        doc = len(self._lengths)
+        tokens = tokenize(text)
+        vocabulary = self.vocabulary
+        for token, count in Counter(tokens).items():
+            if vocabulary is None or token in vocabulary:
+                self._postings.setdefault(token, []).append((doc, count))
+        self._lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        return doc
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def scores(self, tokens) -> np.ndarray:
+        n = len(self._lengths)
+        scores = np.zeros(n)
+        if not n:
+            return scores
+        lengths = np.asarray(self._lengths, dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(self._total_length / n, 1))
+        for token in tokens:
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            docs, counts = np.array(postings).T
+            scores[docs] += idf * counts * (self.k1 + 1) / (counts + norm[docs])
+        return scores
+
+    def rank(self, tokens, limit: int = None) -> np.ndarray:
+        """按分數降序返回回覆編號；同分時保持加入次序"""
+        scores = self.scores(tokens)
+        order = np.argsort(-scores, kind="stable")
+        return order[:limit] if limit is not None else order
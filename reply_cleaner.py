@@ -0,0 +1,77 @@
+import html
+import re
+
+# 單一正則按出現次序掃描回覆 HTML：1 表情圖片的 [alt]、2 換行或區塊標籤、其他標籤、3 HTML 實體
+_MARKUP = re.compile(
+    r'<img\b[^>]*?\balt="(\[[^\]"]+\])"[^>]*>'
+    r'|(<br\b[^>]*>|</?(?:p|div|blockquote|li|ul|ol|tr|h[1-6])\b[^>]*>)'
+    r'|<[^>]*>'
+    r'|(&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);)'
+)
+
+# 引用區塊的開始及結束標籤，用於按嵌套深度移除引用
+_BLOCKQUOTE = re.compile(r'<blockquote\b[^>]*>|</blockquote\s*>', re.IGNORECASE)
+
+# 清理後長度不超過此值的回覆視為無內容
+MIN_REPLY_LENGTH = 6
+
+_unescape = html.unescape
+
+def _replace(match):
+    # 按最後匹配的分組分派，避免逐個檢查分組
+    index = match.lastindex
+    if index is None:
+        return ""
+    if index == 2:
+        return " "
+    if index == 1:
+        return match.group(1)
+    return _unescape(match.group(3))
+
+def strip_quotes(markup: str):
+    """移除回覆中（可多層嵌套的）<blockquote> 引用，返回 (回覆本身的 HTML, 頂層引用數量)
+
+    未閉合的引用視為延續到回覆結尾；多餘的結束標籤忽略。
+    """
+    if "<blockquote" not in markup and "<BLOCKQUOTE" not in markup:
+        return markup, 0
+    parts = []
+    depth = 0
+    quotes = 0
+    position = 0
+    for match in _BLOCKQUOTE.finditer(markup):
+        if match.group()[1] == "/":
+            if depth == 0:
+                continue
+            depth -= 1
+            if depth == 0:
+                position = match.end()
+        else:
+            if depth == 0:
+                parts.append(markup[position:match.start()])
+                quotes += 1
+            depth += 1
+    if depth == 0:
+        parts.append(markup[position:])
+    # 引用前後的內容以空白分隔，之後清理時會被合併
+    return " ".join(parts), quotes
+
+def html_to_text(markup: str) -> str:
+    """把回覆 HTML 轉為純文字
+
+    表情圖片換成 [alt]，<br> 及區塊標籤視為空白，其他標籤移除，HTML 實體還原，均在同一次正則掃描中完成；
+    之後以 str.split 合併連續空白並去除首尾空白。沒有標籤和實體的回覆跳過正則掃描。
+    """
+    if "<" in markup or "&" in markup:
+        markup = _MARKUP.sub(_replace, markup)
+    return " ".join(markup.split())
+
+def clean_reply(markup: str):
+    """清理單條回覆，內容過短時返回 None"""
+    text = html_to_text(markup)
+    return text if len(text) >= MIN_REPLY_LENGTH else None
+
+def clean_replies(messages) -> list:
+    """批量清理一整頁回覆，返回與輸入對應的列表（內容過短的為 None）"""
+    to_text = html_to_text
+    return [text if len(text) >= MIN_REPLY_LENGTH else None for text in map(to_text, messages)]
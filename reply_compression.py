@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+import zlib
+from collections.abc import Sequence
+import streamlit.logger
+from config import CACHE_COMPRESSION
+from records import Reply
+
+try:
+    import zstandard
+except ImportError:  # 未安裝 zstandard 時使用標準庫 zlib
+    zstandard = None
+
+logger = streamlit.logger.get_logger(__name__)
+
+_FIELDS = Reply.__slots__
+
+class Codec:
+    """壓縮算法及等級；zstd 使用模組級函數，可在多個執行緒中同時使用"""
+
+    __slots__ = ("name", "level")
+
+    def __init__(self, name: str, level: int):
+        self.name = name
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return zstandard.compress(data, self.level)
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return zstandard.decompress(data)
+        return zlib.decompress(data)
+
+    def __str__(self):
+        return f"{self.name}-{self.level}"
+
+def make_codec(config: dict = CACHE_COMPRESSION) -> Codec:
+    name = config["CODEC"]
+    if name == "auto":
+        name = "zstd" if zstandard is not None else "zlib"
+    elif name == "zstd" and zstandard is None:
+        logger.warning("zstandard 未安裝，回覆緩存改用 zlib 壓縮")
+        name = "zlib"
+    return Codec(name, config["ZSTD_LEVEL"] if name == "zstd" else config["ZLIB_LEVEL"])
+
+class CompressedReplies(Sequence):
+    """壓縮存放的回覆列表：長度可直接讀取，讀取回覆時才解壓，解壓結果不保留在緩存中
+
+    逐個索引讀取每次都會解壓整個列表；需要多條回覆時應使用切片或迭代。
+    """
+
+    __slots__ = ("data", "count", "raw_bytes", "codec")
+
+    def __init__(self, data: bytes, count: int, raw_bytes: int, codec: Codec):
+        self.data = data
+        self.count = count
+        self.raw_bytes = raw_bytes
+        self.codec = codec
+
+    def __len__(self):
+        return self.count
+
+    # 讀取回覆的方法都只解壓一次；Sequence 預設的 index、__contains__ 等逐個調用 __getitem__，每次都要解壓整個列表
+    def __getitem__(self, index):
+        return self.decompress()[index]
+
+    def __iter__(self):
+        return iter(self.decompress())
+
+    def __reversed__(self):
+        return reversed(self.decompress())
+
+    def __contains__(self, value):
+        return value in self.decompress()
+
+    def index(self, value, *args):
+        return self.decompress().index(value, *args)
+
+    def decompress(self) -> list:
+        return reply_compressor.decompress(self)
+
+class ReplyCompressor:
+    """共享帖子內容緩存的回覆壓縮：回覆 HTML 有大量重複的標籤、表情及引用，壓縮率高"""
+
+    def __init__(self, config: dict = CACHE_COMPRESSION):
+        self.enabled = config["ENABLED"]
+        self.min_bytes = config["MIN_BYTES"]
+        self.codec = make_codec(config)
+        self._lock = threading.Lock()
+        self.stats = {
+            "compressed": 0, "skipped": 0, "decompressed": 0,
+            "raw_bytes": 0, "compressed_bytes": 0,
+            "compress_seconds": 0.0, "decompress_seconds": 0.0
+        }
+
+    def compress(self, replies):
+        """壓縮回覆列表；未啟用或內容太少時原樣返回"""
+        if not self.enabled or isinstance(replies, CompressedReplies):
+            return replies
+        raw = json.dumps([[getattr(reply, field) for field in _FIELDS] for reply in replies], ensure_ascii=False).encode()
+        if len(raw) < self.min_bytes:
+            with self._lock:
+                self.stats["skipped"] += 1
+            return replies
+        start = time.perf_counter()
+        data = self.codec.compress(raw)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats["compressed"] += 1
+            self.stats["raw_bytes"] += len(raw)
+            self.stats["compressed_bytes"] += len(data)
+            self.stats["compress_seconds"] += elapsed
+        return CompressedReplies(data, len(replies), len(raw), self.codec)
+
+    def decompress(self, replies: CompressedReplies) -> list:
+        start = time.perf_counter()
+        rows = json.loads(replies.codec.decompress(replies.data))
+        result = [Reply(**dict(zip(_FIELDS, row))) for row in rows]
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats["decompressed"] += 1
+            self.stats["decompress_seconds"] += elapsed
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["codec"] = str(self.codec)
+        stats["ratio"] = round(stats["raw_bytes"] / stats["compressed_bytes"], 2) if stats["compressed_bytes"] else None
+        return stats
+
+reply_compressor = ReplyCompressor()
@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import threading
+from array import array
+from collections.abc import Sequence
+import streamlit.logger
+from config import REPLY_SPOOL
+from records import Reply
+
+logger = streamlit.logger.get_logger(__name__)
+
+# 每次從臨時檔案讀取的記錄數量
+_READ_BATCH = 256
+
+_stats = {"spooled": 0, "spooled_records": 0, "spooled_bytes": 0}
+_stats_lock = threading.Lock()
+
+class ReplySpool(Sequence):
+    """只追加的記錄列表：前 memory_limit 條保留在記憶體，其後的記錄逐條序列化寫入臨時檔案
+
+    檔案中每條記錄為一行 JSON 欄位值，位置記錄在 offsets（最後一項為檔案結尾）；
+    迭代時按批以 os.pread 讀回，可同時有多個迭代器，也可在其他執行緒中讀取。
+    """
+
+    def __init__(self, record_type=Reply, memory_limit: int = None, config: dict = REPLY_SPOOL):
+        self.record_type = record_type
+        self.fields = record_type.__slots__
+        if memory_limit is None:
+            memory_limit = config["MEMORY_RECORDS"] if config["ENABLED"] else float("inf")
+        self.memory_limit = memory_limit
+        self.directory = config["DIR"]
+        self._memory = []
+        self._file = None
+        self._offsets = array("Q", [0])
+        self._lock = threading.Lock()
+
+    @property
+    def spilled(self) -> int:
+        """寫入臨時檔案的記錄數量"""
+        return len(self._offsets) - 1
+
+    def append(self, record):
+        if len(self._memory) < self.memory_limit and not self.spilled:
+            self._memory.append(record)
+            return
+        line = json.dumps([getattr(record, field) for field in self.fields], ensure_ascii=False).encode() + b"\n"
+        with self._lock:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(prefix="reply_spool_", dir=self.directory)
+                with _stats_lock:
+                    _stats["spooled"] += 1
+                logger.info(f"Reply spool spilling to disk: memory_limit={self.memory_limit}")
+            self._file.write(line)
+            self._offsets.append(self._offsets[-1] + len(line))
+        with _stats_lock:
+            _stats["spooled_records"] += 1
+            _stats["spooled_bytes"] += len(line)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def truncate(self, length: int):
+        """只保留前 length 條記錄"""
+        if length >= len(self):
+            return
+        with self._lock:
+            if length <= len(self._memory):
+                del self._memory[length:]
+                length = 0
+            else:
+                length -= len(self._memory)
+            if self._file is not None:
+                del self._offsets[length + 1:]
+                self._file.truncate(self._offsets[-1])
+                self._file.seek(self._offsets[-1])
+
+    def _read(self, start: int, stop: int) -> list:
+        """讀取檔案中第 start 至 stop 條（不含）記錄"""
+        if start >= stop:
+            return []
+        with self._lock:
+            self._file.flush()
+            begin, end = self._offsets[start], self._offsets[stop]
+            data = os.pread(self._file.fileno(), end - begin, begin)
+        record_type, fields = self.record_type, self.fields
+        return [record_type(**dict(zip(fields, json.loads(line)))) for line in data.splitlines()]
+
+    def __len__(self):
+        return len(self._memory) + self.spilled
+
+    def __iter__(self):
+        yield from self._memory
+        spilled = self.spilled
+        for start in range(0, spilled, _READ_BATCH):
+            yield from self._read(start, min(start + _READ_BATCH, spilled))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            memory = len(self._memory)
+            return self._memory[start:min(stop, memory)] + self._read(max(start - memory, 0), max(stop - memory, 0))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ReplySpool index out of range")
+        if index < len(self._memory):
+            return self._memory[index]
+        index -= len(self._memory)
+        return self._read(index, index + 1)[0]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._memory = []
+            self._offsets = array("Q", [0])
+
+def spool_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
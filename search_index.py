@@ -0,0 +1,226 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import streamlit.logger
+from config import SEARCH_INDEX
+from records import TopicItem
+from relevance import tokenize, token_runs
+from reply_cleaner import html_to_text
+
+logger = streamlit.logger.get_logger(__name__)
+
+# 「有冇人講過XXX」一類問題中要搜尋的內容：優先取引號內的詞語，否則取「講過/提過/關於」之後的部分
+_QUOTED_TERM = re.compile(r"[「『“\"']([^」』”\"']+)[」』”\"']")
+# 只接受明確的搜尋用語；「搵」在一般問題中太常見（例如「幫我搵個好笑嘅帖」），不視為搜尋
+_ASKED_TERM = re.compile(r"(?:講過|提過|提到|討論過|關於|搜尋)\s*(.+?)\s*(?:嘅|的)?\s*(?:帖子?|嘢|內容|回覆)?\s*[？?。！!]*$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    platform TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    cat_id TEXT,
+    title TEXT,
+    no_of_reply INTEGER,
+    last_reply_time REAL,
+    create_time REAL,
+    like_count INTEGER,
+    dislike_count INTEGER,
+    updated_at REAL,
+    raw_id,
+    PRIMARY KEY (platform, thread_id)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    platform TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (platform, thread_id, kind, key)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(tokens, tokenize = 'unicode61');
+"""
+
+def search_terms(question: str):
+    """從用戶問題中取出要搜尋的詞語，問題不是搜尋類型時返回 None"""
+    match = _QUOTED_TERM.search(question) or _ASKED_TERM.search(question.strip())
+    if match is None:
+        return None
+    term = match.group(1).strip()
+    return term if len(tokenize(term)) else None
+
+def _match_expression(text: str) -> str:
+    # 索引內容以二元組存放，查詢的每段文字同樣切分後作為詞組匹配，相當於子字串搜尋；
+    # 單個中文字沒有二元組，以前綴匹配（索引中每段的最後一個字另有單字詞，每個字都是某個詞的開頭）
+    phrases = []
+    for run in token_runs(text):
+        if len(run) == 1 and not run.isascii():
+            phrases.append(f'"{run}" *')
+        else:
+            phrases.append('"' + " ".join(tokenize(run)) + '"')
+    return " AND ".join(phrases)
+
+def _native_id(raw_id, thread_id: str):
+    """還原帖子 ID 原本的類型，與帖子列表及各緩存的鍵一致；舊版索引沒有 raw_id 時數字 ID 轉為 int"""
+    if raw_id is not None:
+        return raw_id
+    return int(thread_id) if thread_id.isdigit() else thread_id
+
+class SearchIndex:
+    """已抓取帖子標題及回覆的本地全文索引（SQLite FTS5）
+
+    中文內容先按 relevance.tokenize 切分為字元二元組再以空格分隔存入 FTS5，
+    查詢時同樣切分並作為詞組匹配，因此不需要額外的中文分詞擴展。
+    """
+
+    def __init__(self, path: str = SEARCH_INDEX["PATH"], config: dict = SEARCH_INDEX):
+        self.path = path
+        self.retention = config["RETENTION_DAYS"] * 86400
+        self.prune_interval = config["PRUNE_INTERVAL"]
+        self._lock = threading.Lock()
+        self._db = None
+        self._pruned_at = 0.0
+        self.stats = {"indexed": 0, "updated": 0, "searches": 0, "pruned": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(threads)")}
+            if "raw_id" not in columns:
+                # 舊版索引：保存帖子 ID 的原本類型（raw_id 沒有類型親和性，int 與 str 原樣保存）
+                self._db.execute("ALTER TABLE threads ADD COLUMN raw_id")
+        return self._db
+
+    def _upsert_entry(self, db, platform: str, thread_id: str, kind: str, key: str, text: str):
+        row = db.execute(
+            "SELECT id, text FROM entries WHERE platform = ? AND thread_id = ? AND kind = ? AND key = ?",
+            (platform, thread_id, kind, key)
+        ).fetchone()
+        tokens = " ".join(tokenize(text, tail=True))
+        if row is None:
+            cursor = db.execute(
+                "INSERT INTO entries (platform, thread_id, kind, key, text) VALUES (?, ?, ?, ?, ?)",
+                (platform, thread_id, kind, key, text)
+            )
+            db.execute("INSERT INTO entries_fts (rowid, tokens) VALUES (?, ?)", (cursor.lastrowid, tokens))
+            self.stats["indexed"] += 1
+        elif row[1] != text:
+            db.execute("UPDATE entries SET text = ? WHERE id = ?", (text, row[0]))
+            db.execute("DELETE FROM entries_fts WHERE rowid = ?", (row[0],))
+            db.execute("INSERT INTO entries_fts (rowid, tokens) VALUES (?, ?)", (row[0], tokens))
+            self.stats["updated"] += 1
+
+    def add_topics(self, platform: str, cat_id, items):
+        """加入帖子列表：保存帖子元數據並索引標題"""
+        id_key = "thread_id" if platform == "LIHKG" else "id"
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            with db:
+                for item in items:
+                    raw_id = item.get(id_key)
+                    thread_id = str(raw_id)
+                    db.execute(
+                        "INSERT OR REPLACE INTO threads (platform, thread_id, cat_id, title, no_of_reply, last_reply_time, "
+                        "create_time, like_count, dislike_count, updated_at, raw_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            platform, thread_id, str(cat_id), item.get("title"), item.get("no_of_reply", 0) or 0,
+                            item.get("last_reply_time", 0) or 0, item.get("create_time", 0) or 0,
+                            item.get("like_count", 0) or 0, item.get("dislike_count", 0) or 0, now,
+                            raw_id if isinstance(raw_id, (int, str)) else thread_id
+                        )
+                    )
+                    if item.get("title"):
+                        self._upsert_entry(db, platform, thread_id, "title", "", item["title"])
+            self._prune(db, now)
+
+    def add_replies(self, platform: str, thread_id, replies):
+        """索引帖子回覆；沒有回覆 ID 的平台以內容雜湊作為鍵"""
+        thread_id = str(thread_id)
+        with self._lock:
+            db = self._connect()
+            with db:
+                for reply in replies:
+                    text = html_to_text(reply.get("msg", ""))
+                    if not text:
+                        continue
+                    key = reply.get("post_id") or reply.get("msg_num") or hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+                    self._upsert_entry(db, platform, thread_id, "reply", str(key), text)
+
+    def _prune(self, db, now: float):
+        """定期清除超過保留期限未再出現在帖子列表的帖子"""
+        if now - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = now
+        cutoff = now - self.retention
+        pruned = db.execute("DELETE FROM threads WHERE updated_at < ?", (cutoff,)).rowcount
+        # 連同已過期帖子的回覆，一併清除沒有對應帖子的孤立回覆（回覆先於帖子列表索引，或帖子在更早的清除中已刪除）
+        orphans = "SELECT id FROM entries WHERE (platform, thread_id) NOT IN (SELECT platform, thread_id FROM threads)"
+        db.execute(f"DELETE FROM entries_fts WHERE rowid IN ({orphans})")
+        db.execute(f"DELETE FROM entries WHERE id IN ({orphans})")
+        if pruned:
+            self.stats["pruned"] += pruned
+            logger.info(f"Search index pruned {pruned} threads older than {self.retention // 86400} days")
+
+    def search(self, platform: str, text: str, limit: int = SEARCH_INDEX["MAX_RESULTS"]) -> list:
+        """按 BM25 返回匹配的標題及回覆：thread_id、kind、text、score（越小越相關）"""
+        if not tokenize(text):
+            return []
+        with self._lock:
+            self.stats["searches"] += 1
+            rows = self._connect().execute(
+                "SELECT e.thread_id, e.kind, e.text, bm25(entries_fts) AS score FROM entries_fts "
+                "JOIN entries e ON e.id = entries_fts.rowid "
+                "WHERE entries_fts MATCH ? AND e.platform = ? ORDER BY score LIMIT ?",
+                (_match_expression(text), platform, limit)
+            ).fetchall()
+        return [{"thread_id": thread_id, "kind": kind, "text": text, "score": score} for thread_id, kind, text, score in rows]
+
+    def search_threads(self, platform: str, text: str, cat_id=None, limit: int = SEARCH_INDEX["MAX_RESULTS"]) -> list:
+        """返回匹配的帖子（格式與帖子列表項目相同），按帖子中最相關的標題或回覆排序；cat_id 不為 None 時只返回該分類的帖子"""
+        if not tokenize(text):
+            return []
+        category = "" if cat_id is None else "AND t.cat_id = ? "
+        params = (_match_expression(text), platform) + (() if cat_id is None else (str(cat_id),)) + (limit * 10,)
+        with self._lock:
+            self.stats["searches"] += 1
+            db = self._connect()
+            # bm25() 不能用於聚合，先取按分數排序的命中，再按帖子合併
+            hits = {}
+            for thread_id, in db.execute(
+                "SELECT e.thread_id FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid "
+                "JOIN threads t ON t.platform = e.platform AND t.thread_id = e.thread_id "
+                f"WHERE entries_fts MATCH ? AND e.platform = ? {category}ORDER BY bm25(entries_fts) LIMIT ?",
+                params
+            ):
+                hits[thread_id] = hits.get(thread_id, 0) + 1
+            if not hits:
+                return []
+            rows = db.execute(
+                "SELECT thread_id, cat_id, title, no_of_reply, last_reply_time, create_time, like_count, dislike_count, raw_id "
+                f"FROM threads WHERE platform = ? AND thread_id IN ({','.join('?' * len(hits))})",
+                (platform, *hits)
+            ).fetchall()
+        threads = {
+            row[0]: TopicItem(
+                thread_id=_native_id(row[8], row[0]), cat_id=cat_id if cat_id is not None else _native_id(None, row[1]),
+                title=row[2], no_of_reply=row[3], last_reply_time=row[4], create_time=row[5],
+                like_count=row[6], dislike_count=row[7], search_hits=hits[row[0]]
+            )
+            for row in rows
+        }
+        return [threads[thread_id] for thread_id in hits if thread_id in threads][:limit]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            db = self._connect()
+            threads = db.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            entries = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return dict(self.stats, threads=threads, entries=entries)
+
+search_index = SearchIndex()
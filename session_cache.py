@@ -0,0 +1,236 @@
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import streamlit.logger
+from config import CACHE
+from async_runtime import current_script_ctx, session_state
+
+logger = streamlit.logger.get_logger(__name__)
+
+def estimate_size(obj, _seen=None) -> int:
+    """粗略估算物件及其引用內容佔用的位元組數"""
+    if _seen is None:
+        _seen = set()
+    obj_id = id(obj)
+    if obj_id in _seen:
+        return 0
+    _seen.add(obj_id)
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, _seen) + estimate_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for value in obj:
+            size += estimate_size(value, _seen)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += estimate_size(vars(obj), _seen)
+    elif hasattr(obj, "__slots__"):
+        for slot in obj.__slots__:
+            if hasattr(obj, slot):
+                size += estimate_size(getattr(obj, slot), _seen)
+    return size
+
+def current_session_id() -> str:
+    ctx = current_script_ctx()
+    return ctx.session_id if ctx is not None else "default"
+
+class MemoryAccountant:
+    """追蹤所有會話緩存的估算大小，超出會話或全局上限時按 LRU 淘汰"""
+
+    def __init__(self, session_max_bytes: int, global_max_bytes: int):
+        self.session_max_bytes = session_max_bytes
+        self.global_max_bytes = global_max_bytes
+        self.lock = threading.RLock()
+        self._stores = weakref.WeakValueDictionary()
+        self.evictions = 0
+
+    def register(self, store):
+        with self.lock:
+            self._stores[id(store)] = store
+
+    def bytes_by_session(self) -> dict:
+        """每個會話的緩存估算大小（位元組）"""
+        with self.lock:
+            gauge = {}
+            for store in list(self._stores.values()):
+                gauge[store.session_id] = gauge.get(store.session_id, 0) + store.nbytes
+            return gauge
+
+    def total_bytes(self) -> int:
+        with self.lock:
+            return sum(store.nbytes for store in list(self._stores.values()))
+
+    def _evict_lru(self, stores) -> bool:
+        candidates = [store for store in stores if store.evictable()]
+        if not candidates:
+            return False
+        victim = min(candidates, key=lambda store: store.oldest_access())
+        victim.evict_oldest()
+        self.evictions += 1
+        return True
+
+    def enforce(self, session_id: str):
+        with self.lock:
+            stores = list(self._stores.values())
+            session_stores = [store for store in stores if store.session_id == session_id]
+            while sum(store.nbytes for store in session_stores) > self.session_max_bytes:
+                if not self._evict_lru(session_stores):
+                    break
+            while sum(store.nbytes for store in stores) > self.global_max_bytes:
+                if not self._evict_lru(stores):
+                    break
+
+memory_accountant = MemoryAccountant(
+    session_max_bytes=CACHE["SESSION_MAX_BYTES"],
+    global_max_bytes=CACHE["GLOBAL_MAX_BYTES"]
+)
+
+class BoundedCache(MutableMapping):
+    """有大小上限的 LRU 字典，大小計入會話及全局記憶體預算"""
+
+    def __init__(self, name: str, max_entries: int = None, session_id: str = None, accountant: MemoryAccountant = memory_accountant):
+        self.name = name
+        self.max_entries = max_entries or CACHE["MAX_ENTRIES"]
+        self.session_id = session_id or current_session_id()
+        self.accountant = accountant
+        self.nbytes = 0
+        self._data = OrderedDict()
+        accountant.register(self)
+
+    def __getitem__(self, key):
+        with self.accountant.lock:
+            value, size, _ = self._data[key]
+            self._data[key] = (value, size, time.time())
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        size = estimate_size(value)
+        with self.accountant.lock:
+            if key in self._data:
+                self.nbytes -= self._data[key][1]
+            self._data[key] = (value, size, time.time())
+            self._data.move_to_end(key)
+            self.nbytes += size
+            while len(self._data) > self.max_entries:
+                self.evict_oldest()
+        self.accountant.enforce(self.session_id)
+
+    def __delitem__(self, key):
+        with self.accountant.lock:
+            _, size, _ = self._data.pop(key)
+            self.nbytes -= size
+
+    def __iter__(self):
+        with self.accountant.lock:
+            return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def peek(self, key, default=None):
+        """讀取值但不更新 LRU 次序"""
+        entry = self._data.get(key)
+        return entry[0] if entry is not None else default
+
+    def refresh(self, key):
+        """值在原地被修改（例如流式回應物化完成）後重新估算其大小"""
+        with self.accountant.lock:
+            if key not in self._data:
+                return
+            value, size, accessed = self._data[key]
+            new_size = estimate_size(value)
+            self._data[key] = (value, new_size, accessed)
+            self.nbytes += new_size - size
+        self.accountant.enforce(self.session_id)
+
+    def evictable(self) -> bool:
+        # 保留最新一項，避免剛寫入的單個大項目立即被淘汰
+        return len(self._data) > 1
+
+    def oldest_access(self) -> float:
+        return next(iter(self._data.values()))[2]
+
+    def evict_oldest(self):
+        key, (_, size, _) = self._data.popitem(last=False)
+        self.nbytes -= size
+        logger.debug(f"Evicted cache entry: cache={self.name}, session={self.session_id}, key={key}, bytes={size}")
+
+class BoundedHistory:
+    """有大小上限的記錄列表，超出上限時移除最舊記錄"""
+
+    def __init__(self, name: str, max_entries: int = None, session_id: str = None, accountant: MemoryAccountant = memory_accountant):
+        self.name = name
+        self.max_entries = max_entries or CACHE["HISTORY_MAX_ENTRIES"]
+        self.session_id = session_id or current_session_id()
+        self.accountant = accountant
+        self.nbytes = 0
+        self._items = []
+        accountant.register(self)
+
+    def append(self, item):
+        size = estimate_size(item)
+        with self.accountant.lock:
+            self._items.append((item, size, time.time()))
+            self.nbytes += size
+            while len(self._items) > self.max_entries:
+                self.evict_oldest()
+        self.accountant.enforce(self.session_id)
+
+    def __iter__(self):
+        with self.accountant.lock:
+            return iter([item for item, _, _ in self._items])
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index][0]
+
+    def evictable(self) -> bool:
+        return len(self._items) > 1
+
+    def oldest_access(self) -> float:
+        return self._items[0][2]
+
+    def evict_oldest(self):
+        _, size, _ = self._items.pop(0)
+        self.nbytes -= size
+
+SHARED_SESSION_ID = "__shared__"
+
+# 跨會話共享的帖子列表及帖子內容緩存，由互動請求和背景預取共同填充
+shared_topic_cache = BoundedCache("shared_topic_cache", session_id=SHARED_SESSION_ID)
+shared_thread_cache = BoundedCache("shared_thread_cache", session_id=SHARED_SESSION_ID)
+
+def get_fresh(cache, key, max_age: float):
+    """返回未過期的緩存項目（含 timestamp 欄位），否則返回 None"""
+    entry = cache.get(key)
+    if entry is not None and time.time() - entry["timestamp"] < max_age:
+        return entry
+    return None
+
+def init_session_cache(name: str, history: bool = False):
+    """在 session_state 中建立有界緩存（或記錄列表），已存在則直接返回"""
+    store_type = BoundedHistory if history else BoundedCache
+    state = session_state()
+    existing = state.get(name)
+    if not isinstance(existing, store_type):
+        store = store_type(name)
+        # 遷移舊版以普通 dict/list 保存的內容
+        if isinstance(existing, dict):
+            for key, value in existing.items():
+                store[key] = value
+        elif isinstance(existing, list):
+            for item in existing:
+                store.append(item)
+        state[name] = store
+    return state[name]
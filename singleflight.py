@@ -0,0 +1,112 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+import streamlit.logger
+
+logger = streamlit.logger.get_logger(__name__)
+
+class SingleFlight:
+    """同一鍵的並發請求只執行一次，重複請求等待同一結果；完成後的結果按 TTL 保留"""
+
+    def __init__(self, ttl: float = 30, name: str = "singleflight"):
+        self.ttl = ttl
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = {
+            "leaders": 0,
+            "inflight_hits": 0,
+            "completed_hits": 0,
+            "errors": 0,
+            "expired": 0
+        }
+
+    def _purge_expired(self, now: float):
+        for key, entry in list(self._entries.items()):
+            if entry["completed"] is not None and now - entry["completed"] >= self.ttl:
+                del self._entries[key]
+                self._stats["expired"] += 1
+
+    async def _run(self, key, entry, factory, share):
+        try:
+            result = await factory()
+            if share is not None:
+                result = share(result)
+        except asyncio.CancelledError:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry["future"].cancel()
+            raise
+        except Exception as e:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                self._stats["errors"] += 1
+            entry["future"].set_exception(e)
+            return
+        with self._lock:
+            entry["completed"] = time.time()
+        entry["future"].set_result(result)
+
+    async def do(self, key, factory, share=None):
+        """執行 factory() 或加入同鍵的進行中請求；share 用於把結果轉換為可共享的形式"""
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {
+                    "future": concurrent.futures.Future(),
+                    "started": now,
+                    "completed": None,
+                    "waiters": 0,
+                    "task": None
+                }
+                self._entries[key] = entry
+                self._stats["leaders"] += 1
+                leader = True
+            else:
+                stat = "inflight_hits" if entry["completed"] is None else "completed_hits"
+                self._stats[stat] += 1
+                leader = False
+            entry["waiters"] += 1
+
+        if leader:
+            # 共享的工作在獨立任務中執行，個別調用方取消時不會中斷其他等待方
+            entry["task"] = asyncio.ensure_future(self._run(key, entry, factory, share))
+        else:
+            logger.info(f"[{self.name}] Joining existing request: key={key}, age={now - entry['started']:.2f}s")
+
+        try:
+            return await asyncio.shield(asyncio.wrap_future(entry["future"]))
+        except asyncio.CancelledError:
+            with self._lock:
+                entry["waiters"] -= 1
+                abandoned = entry["waiters"] == 0 and entry["completed"] is None
+            if abandoned and entry["task"] is not None:
+                # 所有調用方都已放棄，取消共享工作以釋放排程器中的配額
+                logger.info(f"[{self.name}] All callers abandoned request, cancelling: key={key}")
+                entry["task"].cancel()
+            raise
+
+    def forget(self, key):
+        """移除已完成的結果，之後同鍵的請求重新執行"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["completed"] is not None:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        """返回命中統計及當前登記項目數量"""
+        with self._lock:
+            self._purge_expired(time.time())
+            inflight = sum(1 for entry in self._entries.values() if entry["completed"] is None)
+            stats = dict(self._stats)
+            stats["inflight"] = inflight
+            stats["cached"] = len(self._entries) - inflight
+        hits = stats["inflight_hits"] + stats["completed_hits"]
+        total = hits + stats["leaders"]
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
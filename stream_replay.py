@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import streamlit.logger
+
+logger = streamlit.logger.get_logger(__name__)
+
+class ReplayableStream:
+    """包裝單一異步生成器：邊消費邊把文字保存在記憶體，之後可從頭重播而不再調用 API"""
+
+    def __init__(self, source):
+        self._source = source
+        self._chunks = []
+        self._done = False
+        self._error = None
+        self._pumping = False
+        self._pump_task = None
+        self._waiters = []
+        self._lock = threading.Lock()
+
+    @property
+    def is_complete(self) -> bool:
+        return self._done and self._error is None
+
+    @property
+    def failed(self) -> bool:
+        return self._error is not None
+
+    def text(self) -> str:
+        """返回目前已物化的完整文字"""
+        with self._lock:
+            return "".join(self._chunks)
+
+    def _wake_waiters(self):
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve_waiter, waiter)
+            except RuntimeError:
+                # 訂閱者的事件循環已關閉
+                continue
+
+    async def _pump(self):
+        try:
+            chunk = await self._source.__anext__()
+        except StopAsyncIteration:
+            with self._lock:
+                self._done = True
+        except asyncio.CancelledError:
+            # 推進任務本身被取消（例如事件循環關閉）時底層生成器已中斷，之後無法再續讀
+            logger.error("Replayable stream source cancelled")
+            with self._lock:
+                self._done = True
+                self._error = RuntimeError("stream source cancelled")
+                self._pumping = False
+            self._wake_waiters()
+            raise
+        except Exception as e:
+            logger.error(f"Replayable stream source failed: error={str(e)}")
+            with self._lock:
+                self._done = True
+                self._error = e
+        else:
+            with self._lock:
+                self._chunks.append(chunk)
+        with self._lock:
+            self._pumping = False
+        self._wake_waiters()
+
+    async def replay(self):
+        """返回新的生成器：先重播已緩存的片段，再跟隨底層生成器；任一讀者都可推進底層生成器"""
+        index = 0
+        while True:
+            waiter = None
+            with self._lock:
+                if index < len(self._chunks):
+                    action = "yield"
+                    chunk = self._chunks[index]
+                    index += 1
+                elif self._done:
+                    action = "stop"
+                elif self._pumping:
+                    action = "wait"
+                    loop = asyncio.get_running_loop()
+                    waiter = loop.create_future()
+                    self._waiters.append((loop, waiter))
+                else:
+                    action = "pump"
+                    self._pumping = True
+
+            if action == "yield":
+                yield chunk
+            elif action == "stop":
+                if self._error is not None:
+                    raise self._error
+                return
+            elif action == "wait":
+                await waiter
+            else:
+                # 在獨立任務中推進底層生成器：讀者被取消（例如 Streamlit 重新執行腳本）時
+                # 只中斷該讀者的等待，生成器不會收到取消而提前結束，其他讀者可繼續讀取
+                task = asyncio.ensure_future(self._pump())
+                self._pump_task = task
+                await asyncio.shield(task)
+
+def _resolve_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -9,6 +9,19 @@ import hashlib
 import json
 from lihkg_api import get_lihkg_topic_list
 from hkgolden_api import get_hkgolden_topic_list
+from session_cache import init_session_cache, memory_accountant, current_session_id
+from async_runtime import get_runtime
+from fetch_scheduler import fetch_scheduler, with_priority, BULK
+from pacing import pacer_registry
+from circuit_breaker import breaker_registry
+from negative_cache import negative_cache
+from forum_http import coalescing_stats
+from hedging import hedge_policy
+from topic_table import topic_tables
+from thread_metrics import thread_metrics
+from search_index import search_index
+from reply_compression import reply_compressor
+from reply_spool import spool_stats
 import streamlit.logger
 from config import LIHKG_API, HKGOLDEN_API, GENERAL, GROK3_API
 from threading import Lock
@@ -131,7 +144,8 @@ async def test_grok3_api(prompt, high_reasoning=False):
             logger.error(f"Grok 3 API test unexpected error: type={type(e).__name__}, message={str(e)}")
             return {"error": f"API unexpected error - {str(e)}"}
 
-async def test_page():
+def test_page():
+    runtime = get_runtime()
     st.title("討論區數據測試頁面")
     
     if "rate_limit_until" not in st.session_state:
@@ -140,8 +154,7 @@ async def test_page():
         st.session_state.request_counter = 0
     if "last_reset" not in st.session_state:
         st.session_state.last_reset = time.time()
-    if "thread_content_cache" not in st.session_state:
-        st.session_state.thread_content_cache = {}
+    init_session_cache("thread_content_cache")
     if "last_api_test_time" not in st.session_state:
         st.session_state.last_api_test_time = 0
     
@@ -174,12 +187,87 @@ async def test_page():
             f"{datetime.fromtimestamp(st.session_state.rate_limit_until, tz=HONG_KONG_TZ).strftime('%Y-%m-%d %H:%M:%S') if st.session_state.rate_limit_until > time.time() else 'None'}"
         )
         
+        bytes_by_session = memory_accountant.bytes_by_session()
+        st.markdown("#### Cache Memory")
+        st.markdown(f"- This session: {bytes_by_session.get(current_session_id(), 0) / 1024:.1f} KB")
+        st.markdown(f"- All sessions: {sum(bytes_by_session.values()) / 1024:.1f} KB across {len(bytes_by_session)} sessions, evictions={memory_accountant.evictions}")
+        scheduler_stats = fetch_scheduler.stats().get(platform)
+        if scheduler_stats:
+            st.markdown("#### Fetch Scheduler")
+            st.markdown(f"- Queued: {scheduler_stats['queued']}, in window: {scheduler_stats['in_window']}/{scheduler_stats['max_requests']}")
+            for class_name, class_stats in scheduler_stats["classes"].items():
+                st.markdown(f"- {class_name}: granted={class_stats['granted']}, preempted={class_stats['preempted']}, cancelled={class_stats['cancelled']}")
+        breaker_stats = breaker_registry.stats()
+        if breaker_stats:
+            st.markdown("#### Circuit Breakers")
+            for host, host_stats in breaker_stats.items():
+                st.markdown(
+                    f"- {host}: state={host_stats['state']}, retry_in={host_stats['retry_in']}s, "
+                    f"opened={host_stats['opened']}, rejected={host_stats['rejected']}, failures={host_stats['failures']}"
+                )
+        negative_stats = negative_cache.snapshot()
+        st.markdown(
+            f"- Negative cache: entries={negative_stats['entries']}, known_dead={negative_stats['known_dead']}, "
+            f"hits={negative_stats['hits']}, bloom_hits={negative_stats['bloom_hits']}"
+        )
+        coalescing = coalescing_stats()
+        st.markdown(f"- Coalesced page requests: {coalescing['coalesced']} saved of {coalescing['requests'] + coalescing['coalesced']} ({coalescing['saved_ratio']:.1%})")
+        hedge_stats = hedge_policy.stats()
+        if hedge_stats:
+            st.markdown("#### Request Latency")
+            for host, host_stats in hedge_stats.items():
+                request_latency, observed_latency = host_stats["request"], host_stats["observed"]
+                st.markdown(
+                    f"- {host}: hedged={host_stats['hedged']}, hedge_wins={host_stats['hedge_wins']}, "
+                    f"skipped_no_budget={host_stats['skipped_no_budget']}, threshold={host_stats['threshold']}s"
+                )
+                st.markdown(
+                    f"  - per request p50/p90/p99: {request_latency['p50']}/{request_latency['p90']}/{request_latency['p99']}s ({request_latency['samples']} samples); "
+                    f"observed: {observed_latency['p50']}/{observed_latency['p90']}/{observed_latency['p99']}s"
+                )
+        table_stats = topic_tables.stats().get(f"{platform}:{cat_id}")
+        if table_stats:
+            st.markdown(
+                f"- Topic table: rows={table_stats['rows']}, full_syncs={table_stats['full_syncs']}, delta_syncs={table_stats['delta_syncs']}, "
+                f"added={table_stats['added']}, updated={table_stats['updated']}, age={table_stats['age']}s"
+            )
+        metrics_stats = thread_metrics.snapshot()
+        st.markdown(
+            f"- Thread metrics: threads={metrics_stats['threads']}, rows={metrics_stats['rows']}/{metrics_stats['capacity']}, "
+            f"merged={metrics_stats['merged']}, compactions={metrics_stats['compactions']}"
+        )
+        index_stats = search_index.snapshot()
+        st.markdown(
+            f"- Search index: threads={index_stats['threads']}, entries={index_stats['entries']}, "
+            f"indexed={index_stats['indexed']}, searches={index_stats['searches']}, pruned={index_stats['pruned']}"
+        )
+        compression_stats = reply_compressor.snapshot()
+        st.markdown(
+            f"- Reply cache compression: codec={compression_stats['codec']}, compressed={compression_stats['compressed']}, "
+            f"raw={compression_stats['raw_bytes'] / 1024:.1f}KB, stored={compression_stats['compressed_bytes'] / 1024:.1f}KB, "
+            f"ratio={compression_stats['ratio']}, decompressed={compression_stats['decompressed']}"
+        )
+        spooled = spool_stats()
+        st.markdown(
+            f"- Reply spool: spooled_threads={spooled['spooled']}, spooled_replies={spooled['spooled_records']}, "
+            f"spooled={spooled['spooled_bytes'] / 1024:.1f}KB"
+        )
+        pacing_stats = pacer_registry.stats()
+        if pacing_stats:
+            st.markdown("#### Request Pacing")
+            for host, host_stats in pacing_stats.items():
+                st.markdown(
+                    f"- {host}: rate={host_stats['rate']}/s, effective={host_stats['effective_rate']}/s, "
+                    f"throttled={host_stats['throttled']}, slow={host_stats['slow']}, blocked_for={host_stats['blocked_for']}s"
+                )
+        
         if st.button("Fetch Data"):
             with st.spinner("Fetching data..."):
+                # 手動批量抓取使用 BULK 優先級：只佔用 BULK_SHARE 的配額，並讓互動請求優先
                 logger.info(f"Starting data fetch: platform={platform}, category={selected_cat}, cat_id={cat_id}, pages={max_pages}")
                 
                 if platform == "LIHKG":
-                    result = await get_lihkg_topic_list(
+                    result = runtime.run(with_priority(BULK, get_lihkg_topic_list(
                         cat_id,
                         sub_cat_id=0,
                         start_page=1,
@@ -187,9 +275,9 @@ async def test_page():
                         request_counter=st.session_state.request_counter,
                         last_reset=st.session_state.last_reset,
                         rate_limit_until=st.session_state.rate_limit_until
-                    )
+                    )))
                 else:
-                    result = await get_hkgolden_topic_list(
+                    result = runtime.run(with_priority(BULK, get_hkgolden_topic_list(
                         cat_id,
                         sub_cat_id=0,
                         start_page=1,
@@ -197,7 +285,7 @@ async def test_page():
                         request_counter=st.session_state.request_counter,
                         last_reset=st.session_state.last_reset,
                         rate_limit_until=st.session_state.rate_limit_until
-                    )
+                    )))
                 
                 items = result["items"]
                 rate_limit_info = result["rate_limit_info"]
@@ -257,7 +345,7 @@ async def test_page():
                     thread_id = int(thread_id_input)
                     with st.spinner(f"Querying thread {thread_id} info..."):
                         logger.info(f"Querying thread info: platform={platform}, thread_id={thread_id}")
-                        thread_data = await search_thread_by_id(thread_id, platform)
+                        thread_data = runtime.run(search_thread_by_id(thread_id, platform))
                         
                         if thread_data:
                             thread_title = thread_data.get("title", "Unknown title")
@@ -294,7 +382,7 @@ async def test_page():
                 st.session_state.last_api_test_time = time.time()
             
             with st.spinner("Testing Grok 3 API..."):
-                result = await test_grok3_api(test_prompt, high_reasoning)
+                result = runtime.run(test_grok3_api(test_prompt, high_reasoning))
                 st.markdown("#### API Test Results")
                 if "error" in result:
                     st.error(f"API Test Failed: {result['error']}")
@@ -0,0 +1,146 @@
+import math
+import threading
+import time
+import numpy as np
+import streamlit.logger
+from config import THREAD_METRICS
+
+logger = streamlit.logger.get_logger(__name__)
+
+class ThreadMetrics:
+    """帖子列表快照的時間序列存儲
+
+    每次抓取帖子列表時記錄 (帖子, 時間, 回覆數, 點讚數, 負評數)。快照以 NumPy 陣列只追加存放，
+    同一帖子在 RESOLUTION 內的快照合併為一筆，超過 RETENTION 的快照在容量用盡時清除。
+    另以帖子槽位保存最後一次快照及指數平滑的回覆速度，查詢每個帖子的近期速度為 O(1)。
+    """
+
+    LOG_FIELDS = (("ts", np.float64), ("slot", np.int32), ("no_of_reply", np.int32), ("like_count", np.int32), ("dislike_count", np.int32))
+    SLOT_FIELDS = (("last_ts", np.float64), ("last_replies", np.float64), ("velocity", np.float64), ("last_row", np.int64))
+
+    def __init__(self, config: dict = THREAD_METRICS):
+        self.resolution = config["RESOLUTION"]
+        self.retention = config["RETENTION"]
+        self.max_rows = config["MAX_ROWS"]
+        self.min_interval = config["MIN_INTERVAL"]
+        # 指數平滑的時間常數：經過一個半衰期後舊速度的權重降至一半
+        self.tau = config["VELOCITY_HALFLIFE"] / math.log(2)
+        self._lock = threading.Lock()
+        self._rows = 0
+        self._log = {name: np.zeros(config["INITIAL_ROWS"], dtype=dtype) for name, dtype in self.LOG_FIELDS}
+        self._slots = {}
+        self._free_slots = []
+        self._slot_state = {name: np.zeros(256, dtype=dtype) for name, dtype in self.SLOT_FIELDS}
+        self.stats = {"snapshots": 0, "merged": 0, "compactions": 0, "expired_threads": 0}
+
+    def _slot(self, key) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            return slot
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._slots)
+            if slot >= len(self._slot_state["last_ts"]):
+                for name, array in self._slot_state.items():
+                    self._slot_state[name] = np.concatenate([array, np.zeros(len(array), dtype=array.dtype)])
+        self._slots[key] = slot
+        self._slot_state["last_ts"][slot] = 0.0
+        self._slot_state["velocity"][slot] = np.nan
+        self._slot_state["last_row"][slot] = -1
+        return slot
+
+    def record(self, platform: str, items, id_key: str = None, now: float = None):
+        """記錄一次帖子列表回應中所有帖子的快照"""
+        now = time.time() if now is None else now
+        id_key = id_key or ("thread_id" if platform == "LIHKG" else "id")
+        with self._lock:
+            state = self._slot_state
+            for item in items:
+                slot = self._slot((platform, str(item.get(id_key))))
+                replies = item.get("no_of_reply", 0) or 0
+                last_ts = state["last_ts"][slot]
+                elapsed = now - last_ts
+                if last_ts and elapsed >= self.min_interval:
+                    # 回覆數可能因刪帖減少，速度不取負值
+                    instant = max(replies - state["last_replies"][slot], 0) / (elapsed / 3600)
+                    previous = state["velocity"][slot]
+                    if np.isnan(previous):
+                        state["velocity"][slot] = instant
+                    else:
+                        alpha = 1 - math.exp(-elapsed / self.tau)
+                        state["velocity"][slot] = alpha * instant + (1 - alpha) * previous
+                if not last_ts or elapsed >= self.min_interval:
+                    state["last_ts"][slot] = now
+                    state["last_replies"][slot] = replies
+                self._append(slot, now, replies, item.get("like_count", 0) or 0, item.get("dislike_count", 0) or 0)
+
+    def _append(self, slot: int, now: float, replies: int, likes: int, dislikes: int):
+        row = self._slot_state["last_row"][slot]
+        if row >= 0 and now - self._log["ts"][row] < self.resolution:
+            # 降採樣：同一時間桶內覆寫該帖子最後一筆快照
+            self.stats["merged"] += 1
+        else:
+            if self._rows >= len(self._log["ts"]):
+                self._compact(now)
+            row = self._rows
+            self._rows += 1
+            self._log["ts"][row] = now
+            self._log["slot"][row] = slot
+            self._slot_state["last_row"][slot] = row
+            self.stats["snapshots"] += 1
+        self._log["no_of_reply"][row] = replies
+        self._log["like_count"][row] = likes
+        self._log["dislike_count"][row] = dislikes
+
+    def _compact(self, now: float):
+        """清除超過保留期限的快照及帖子；仍不足一半空間時擴容，已達上限則丟棄最舊的一半"""
+        count = self._rows
+        keep = self._log["ts"][:count] >= now - self.retention
+        if np.count_nonzero(keep) > count // 2 and len(self._log["ts"]) >= self.max_rows:
+            keep &= np.arange(count) >= count // 2
+        new_index = np.cumsum(keep) - 1
+        for name, array in self._log.items():
+            self._log[name][:int(np.count_nonzero(keep))] = array[:count][keep]
+        self._rows = int(np.count_nonzero(keep))
+        last_row = self._slot_state["last_row"]
+        valid = last_row >= 0
+        valid[valid] = keep[last_row[valid]]
+        self._slot_state["last_row"] = np.where(valid, new_index[np.maximum(last_row, 0)], -1)
+        # 超過保留期限未再出現的帖子釋放槽位
+        expired = [key for key, slot in self._slots.items() if self._slot_state["last_ts"][slot] < now - self.retention]
+        for key in expired:
+            self._free_slots.append(self._slots.pop(key))
+        self.stats["expired_threads"] += len(expired)
+        if self._rows > len(self._log["ts"]) // 2 and len(self._log["ts"]) < self.max_rows:
+            size = min(len(self._log["ts"]) * 2, self.max_rows)
+            for name, array in self._log.items():
+                grown = np.zeros(size, dtype=array.dtype)
+                grown[:len(array)] = array
+                self._log[name] = grown
+        self.stats["compactions"] += 1
+        logger.debug(f"Thread metrics compacted: rows={self._rows}, capacity={len(self._log['ts'])}, expired_threads={len(expired)}")
+
+    def velocities(self, platform: str, thread_ids) -> np.ndarray:
+        """返回各帖子的近期回覆速度（每小時回覆數）；快照不足的帖子為 NaN"""
+        with self._lock:
+            slots = np.fromiter((self._slots.get((platform, str(thread_id)), -1) for thread_id in thread_ids), dtype=np.int64, count=len(thread_ids))
+            result = np.full(len(slots), np.nan)
+            known = slots >= 0
+            result[known] = self._slot_state["velocity"][slots[known]]
+            return result
+
+    def history(self, platform: str, thread_id) -> dict:
+        """返回單一帖子保留中的快照（按時間排序），用於調試"""
+        with self._lock:
+            slot = self._slots.get((platform, str(thread_id)))
+            if slot is None:
+                return {name: np.empty(0, dtype=dtype) for name, dtype in self.LOG_FIELDS if name != "slot"}
+            rows = np.flatnonzero(self._log["slot"][:self._rows] == slot)
+            return {name: self._log[name][rows].copy() for name, _ in self.LOG_FIELDS if name != "slot"}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, rows=self._rows, capacity=len(self._log["ts"]), threads=len(self._slots))
+
+thread_metrics = ThreadMetrics()
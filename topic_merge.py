@@ -0,0 +1,53 @@
+import streamlit.logger
+
+logger = streamlit.logger.get_logger(__name__)
+
+def freshness(item):
+    """比較同一帖子兩份元數據的新舊：最後回覆時間優先，其次回覆數量"""
+    return (item.get("last_reply_time", 0) or 0, item.get("no_of_reply", 0) or 0)
+
+class TopicMerger:
+    """按帖子 ID 合併多頁帖子列表；同一帖子在翻頁期間被頂上而重複出現時，保留最新的元數據"""
+
+    def __init__(self, id_key: str, stop_on_no_new: bool = False, watermark: float = None):
+        self.id_key = id_key
+        self.stop_on_no_new = stop_on_no_new
+        self.watermark = watermark
+        self._items = {}
+        self.duplicates = 0
+        self.stop_reason = None
+
+    def add_page(self, page_items) -> int:
+        """合併一頁帖子，返回此頁新增的帖子數量"""
+        new_count = 0
+        for item in page_items:
+            thread_id = item.get(self.id_key)
+            existing = self._items.get(thread_id)
+            if existing is None:
+                self._items[thread_id] = item
+                new_count += 1
+                continue
+            self.duplicates += 1
+            if freshness(item) >= freshness(existing):
+                # 替換內容但保留首次出現的位置
+                self._items[thread_id] = item
+        return new_count
+
+    def should_stop(self, page_items, new_count: int) -> bool:
+        """判斷是否停止翻頁：此頁沒有新帖子，或已翻到早於 last_reply_time 水位線的帖子（列表按最後回覆時間降序）"""
+        if self.stop_on_no_new and page_items and new_count == 0:
+            self.stop_reason = "no_new_threads"
+        elif self.watermark is not None and page_items and \
+                min(item.get("last_reply_time", 0) or 0 for item in page_items) < self.watermark:
+            self.stop_reason = "below_watermark"
+        return self.stop_reason is not None
+
+    @property
+    def items(self) -> list:
+        return list(self._items.values())
+
+    def __len__(self):
+        return len(self._items)
+
+    def summary(self) -> dict:
+        return {"unique": len(self._items), "duplicates": self.duplicates, "stop_reason": self.stop_reason}
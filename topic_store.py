@@ -0,0 +1,56 @@
+import numpy as np
+from ranking import top_k_indices
+
+# 超出此值的時間戳無法轉換為日期，視為無效（公元 3000 年）
+MAX_TIMESTAMP = 32503680000
+
+class TopicColumns:
+    """帖子列表的列式存儲：數值欄位存為 NumPy 陣列，篩選條件以向量運算產生布林遮罩"""
+
+    NUMERIC_FIELDS = ("last_reply_time", "create_time", "no_of_reply", "like_count", "dislike_count")
+
+    def __init__(self, items, id_key: str = "thread_id", platform: str = None):
+        self.items = list(items)
+        self.platform = platform
+        n = len(self.items)
+        self.thread_ids = np.empty(n, dtype=object)
+        self.thread_ids[:] = [item.get(id_key, item.get("id", item.get("thread_id"))) for item in self.items]
+        for field in self.NUMERIC_FIELDS:
+            setattr(self, field, np.fromiter((item.get(field, 0) or 0 for item in self.items), dtype=np.float64, count=n))
+        self.titles = np.array([(item.get("title") or "").lower() for item in self.items], dtype=str)
+
+    def __len__(self):
+        return len(self.items)
+
+    def all(self) -> np.ndarray:
+        return np.ones(len(self.items), dtype=bool)
+
+    def replied_since(self, timestamp: float) -> np.ndarray:
+        """最後回覆時間有效且不早於 timestamp"""
+        return (self.last_reply_time >= timestamp) & (self.last_reply_time < MAX_TIMESTAMP)
+
+    def has_replies(self) -> np.ndarray:
+        return self.no_of_reply > 0
+
+    def created_since(self, timestamp: float) -> np.ndarray:
+        """發布時間不早於 timestamp；沒有發布時間的帖子視為符合"""
+        return (self.create_time == 0) | (self.create_time >= timestamp)
+
+    def title_matches(self, matcher) -> np.ndarray:
+        """標題包含 matcher（KeywordMatcher）任一關鍵字的帖子"""
+        return matcher.contains_any_batch(self.titles.tolist())
+
+    def exclude(self, mask: np.ndarray, predicate) -> np.ndarray:
+        """對遮罩中仍保留的帖子逐個調用 predicate(thread_id)，返回 True 的帖子被排除"""
+        result = mask.copy()
+        for index in np.flatnonzero(mask):
+            if predicate(self.thread_ids[index]):
+                result[index] = False
+        return result
+
+    def top_k(self, mask: np.ndarray, k: int, keys) -> np.ndarray:
+        """返回遮罩內按 keys（欄位名，依次比較，全部降序）排名前 k 的索引"""
+        return top_k_indices(mask, k, [getattr(self, key) for key in keys])
+
+    def take(self, indices) -> list:
+        return [self.items[index] for index in indices]
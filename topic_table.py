@@ -0,0 +1,96 @@
+import threading
+import time
+import streamlit.logger
+from config import TOPIC_SYNC
+from topic_merge import freshness
+
+logger = streamlit.logger.get_logger(__name__)
+
+class TopicTable:
+    """單一分類的帖子表：按帖子 ID 保存最新元數據，並記錄已見過的最高 last_reply_time 作為增量同步的水位線"""
+
+    def __init__(self, platform: str, cat_id, max_items: int = TOPIC_SYNC["MAX_ITEMS"]):
+        self.platform = platform
+        self.cat_id = cat_id
+        self.max_items = max_items
+        self.id_key = "thread_id" if platform == "LIHKG" else "id"
+        self._rows = {}
+        self.watermark = None
+        self.pages = 0
+        self.full_synced_at = 0.0
+        self.synced_at = 0.0
+        self.stats = {"full_syncs": 0, "delta_syncs": 0, "added": 0, "updated": 0}
+
+    def needs_full_sync(self, pages: int, interval: float = TOPIC_SYNC["FULL_RESYNC_INTERVAL"]) -> bool:
+        # 未同步過、需要更多頁數，或定期完整同步以清除已刪除或跌出列表範圍的帖子
+        return self.watermark is None or pages > self.pages or time.time() - self.full_synced_at >= interval
+
+    def replace(self, items, pages: int):
+        """完整同步：以新列表取代整個表"""
+        self._rows = {}
+        self.watermark = None
+        self.pages = pages
+        self.merge(items)
+        self.full_synced_at = self.synced_at
+        self.stats["full_syncs"] += 1
+
+    def apply_delta(self, items):
+        added, updated = self.merge(items)
+        self.stats["delta_syncs"] += 1
+        logger.info(f"Topic table delta sync: platform={self.platform}, cat_id={self.cat_id}, added={added}, updated={updated}, rows={len(self._rows)}")
+
+    def merge(self, items):
+        added = updated = 0
+        for item in items:
+            thread_id = item.get(self.id_key)
+            existing = self._rows.get(thread_id)
+            if existing is None:
+                added += 1
+            elif freshness(item) > freshness(existing):
+                updated += 1
+            else:
+                continue
+            self._rows[thread_id] = item
+            last_reply_time = item.get("last_reply_time", 0) or 0
+            if self.watermark is None or last_reply_time > self.watermark:
+                self.watermark = last_reply_time
+        if len(self._rows) > self.max_items:
+            # 只保留最近活躍的帖子
+            keep = sorted(self._rows.values(), key=freshness, reverse=True)[:self.max_items]
+            self._rows = {item.get(self.id_key): item for item in keep}
+        self.synced_at = time.time()
+        self.stats["added"] += added
+        self.stats["updated"] += updated
+        return added, updated
+
+    def items(self) -> list:
+        """按最後回覆時間降序返回所有帖子"""
+        return sorted(self._rows.values(), key=freshness, reverse=True)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, rows=len(self._rows), watermark=self.watermark, age=round(time.time() - self.synced_at, 1))
+
+class TopicTableRegistry:
+    """按 (平台, 分類) 保存帖子表，跨會話及跨刷新共用"""
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, platform: str, cat_id) -> TopicTable:
+        with self._lock:
+            table = self._tables.get((platform, cat_id))
+            if table is None:
+                table = TopicTable(platform, cat_id)
+                self._tables[(platform, cat_id)] = table
+            return table
+
+    def stats(self) -> dict:
+        with self._lock:
+            tables = dict(self._tables)
+        return {f"{platform}:{cat_id}": table.snapshot() for (platform, cat_id), table in tables.items()}
+
+topic_tables = TopicTableRegistry()
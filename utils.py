@@ -1,13 +1,11 @@
-import re
+from reply_cleaner import html_to_text
 from datetime import datetime
 import pytz
 
 HONG_KONG_TZ = pytz.timezone("Asia/Hong_Kong")
 
 def clean_html(text):
-    clean = re.compile(r'<[^>]+>')
-    text = clean.sub('', text)
-    return re.sub(r'\s+', ' ', text).strip()
+    return html_to_text(text)
 
 def try_parse_date(date_str):
     try: